@@ -0,0 +1,50 @@
+import asyncio
+
+from app.core.config import settings
+
+
+class Admission:
+    """
+    Giới hạn số request upstream chạy đồng thời (Condition + counter).
+    Khác Semaphore: đổi được giới hạn lúc đang chạy bằng resize().
+    """
+
+    def __init__(self, limit: int):
+        self._cond = asyncio.Condition()
+        self._active = 0
+        self._limit = limit
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self._limit)
+            self._active += 1
+
+    async def release(self) -> None:
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify(1)
+
+    async def resize(self, limit: int) -> None:
+        async with self._cond:
+            self._limit = limit
+            # tăng giới hạn => đánh thức hết, ai đủ chỗ thì vào
+            self._cond.notify_all()
+
+    async def __aenter__(self) -> "Admission":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.release()
+
+
+# dùng chung cho proxy ảnh / HLS và tải ảnh detect
+upstream_admission = Admission(settings.UPSTREAM_MAX_CONCURRENCY)
@@ -1,18 +1,4 @@
-# from pydantic_settings import BaseSettings
-# import os
-
-# class Settings(BaseSettings):
-#     DATA: str = "app\\data\\ITS.link.json"
-#     API_PREFIX: str = "/api"
-#     YOLO_MODEL_PATH: str = "app\\preTrainedModels\\yolov12x.pt"
-#     ZONES_DIR: str = "app\\data\\zones"
-#     PARKING_VIOLATION_THRESHOLD: int = 10
-
-# settings = Settings()
-
-# os.makedirs(os.path.join(os.path.dirname(__file__), "..", "data", "zones"), exist_ok=True)
-
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 import os
 
 
@@ -21,6 +7,9 @@ def _norm(p: str) -> str:
 
 
 class Settings(BaseSettings):
+    # chỉ đọc biến môi trường (không quét .env), không cho sửa sau khi khởi tạo
+    model_config = SettingsConfigDict(frozen=True, env_file=None)
+
     DATA: str = _norm("app/data/ITS.link.json")
     API_PREFIX: str = "/api"
 
@@ -28,22 +17,38 @@ class Settings(BaseSettings):
     ZONES_DIR: str = _norm("app/data/zones")
 
     PARKING_VIOLATION_THRESHOLD: int = 10
+    # True: luôn lọc nhiễu (open/close) mask đèn giao thông như cũ; False: chỉ với ROI lớn
+    TL_DENOISE: bool = False
+    # ROI đèn lớn: thu nhỏ trước khi phân tích màu (False: luôn dùng độ phân giải gốc)
+    TL_DOWNSAMPLE: bool = True
 
     UPLOAD_DIR: str = _norm("app/tmp/uploads")
     OUTPUT_DIR: str = _norm("app/tmp/outputs")
     JOB_TTL_SECONDS: int = 3600
 
+    # số request đồng thời tối đa tới upstream (proxy ảnh/HLS, tải ảnh detect)
+    UPSTREAM_MAX_CONCURRENCY: int = 64
+    # kích thước tối đa của ảnh tải về để detect (/detect-image)
+    IMAGE_FETCH_MAX_BYTES: int = 32 * 1024 * 1024
+
 
 settings = Settings()
 
 
 def _ensure_dir(path: str) -> None:
-    p = _norm(path)
-    if not os.path.isabs(p):
-        p = os.path.normpath(os.path.join(os.getcwd(), p))
-    os.makedirs(p, exist_ok=True)
-
-
-_ensure_dir(settings.ZONES_DIR)
-_ensure_dir(settings.UPLOAD_DIR)
-_ensure_dir(settings.OUTPUT_DIR)
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        # parent chưa tồn tại (lần chạy đầu) => tạo cả cây
+        os.makedirs(path, exist_ok=True)
+
+
+_ABS_DIRS = tuple(
+    os.path.abspath(d)
+    for d in (settings.ZONES_DIR, settings.UPLOAD_DIR, settings.OUTPUT_DIR)
+)
+
+for _d in _ABS_DIRS:
+    _ensure_dir(_d)
@@ -2,6 +2,8 @@ import time
 import uuid
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 class RequestIdLoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -13,3 +15,20 @@ class RequestIdLoggingMiddleware(BaseHTTPMiddleware):
         response.headers["x-request-id"] = rid
         response.headers["x-response-ms"] = str(int((time.time() - start) * 1000))
         return response
+
+
+class SelectiveGZipMiddleware:
+    """
+    GZip cho JSON / playlist, bỏ qua các path trả về nhị phân đã nén sẵn (JPEG, .ts)
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, exclude_prefixes: tuple[str, ...] = ()):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self.exclude_prefixes = exclude_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.exclude_prefixes):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
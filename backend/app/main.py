@@ -1,18 +1,70 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+
+import httpx
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from app.core.config import settings
+from app.core.middleware import SelectiveGZipMiddleware
 from app.routes.camera_routes import router as camera_router
 from app.routes.detection_routes import router as detection_router
 from app.routes.proxy_routes import router as proxy_router
 from app.routes.search_routes import router as search_router
 from app.routes.media_routes import router as media_router
 from app.routes.upload_detect_routes import router as upload_detect_router
+from app.services.camera_service import preload_cameras, watch_cameras
+
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # một AsyncClient dùng chung: giữ keep-alive / connection pool giữa các request
+    app.state.http = httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=20,
+        http2=True,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    )
+    # parse danh sách camera một lần lúc boot, sau đó task nền theo dõi mtime
+    try:
+        preload_cameras()
+    except (OSError, ValueError) as e:
+        # thiếu / hỏng file camera không được chặn cả app (proxy, detect, zones vẫn chạy);
+        # list_camera vẫn tự _load_json lại, watcher nạp khi file có lại
+        logger.warning("Cannot preload cameras from %s: %s", settings.DATA, e)
+    camera_watcher = asyncio.create_task(watch_cameras())
+    try:
+        yield
+    finally:
+        camera_watcher.cancel()
+        with suppress(asyncio.CancelledError):
+            await camera_watcher
+        await app.state.http.aclose()
 
 
 app = FastAPI(
     title="ITS - Intelligent Transport System",
     description="Vehicle Detection & Monitoring API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson serialize nhanh hơn json stdlib nhiều lần (detections lớn, base64 dài)
+    default_response_class=ORJSONResponse,
+)
+
+# nén JSON + playlist m3u8; ảnh / segment / media đã nén sẵn => gzip lại chỉ tốn CPU
+app.add_middleware(
+    SelectiveGZipMiddleware,
+    minimum_size=1024,
+    exclude_prefixes=(
+        f"{settings.API_PREFIX}/proxy/image",
+        f"{settings.API_PREFIX}/proxy/hls/segment",
+        f"{settings.API_PREFIX}/media/",
+        f"{settings.API_PREFIX}/detect-image/annotated.jpg",
+    ),
 )
 
 app.add_middleware(
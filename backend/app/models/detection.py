@@ -99,3 +99,12 @@ class DetectResponse(BaseModel):
     violations: list[ParkingViolation] = Field(default_factory=list)
     red_light_violations: list[RedLightViolation] = Field(default_factory=list)
     error: Optional[str] = None
+
+
+class DetectionStreamMessage(BaseModel):
+    # message "detection_result" gửi qua websocket, serialize bằng model_dump_json
+    type: Literal["detection_result"] = "detection_result"
+    result: DetectionResult
+    violations: list[ParkingViolation] = Field(default_factory=list)
+    red_light_violations: list[RedLightViolation] = Field(default_factory=list)
+    timestamp: str
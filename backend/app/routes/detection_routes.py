@@ -1,5 +1,7 @@
 import asyncio
+import functools
 import json
+import time
 from datetime import datetime
 from typing import Optional
 from urllib.parse import urlparse
@@ -7,6 +9,7 @@ from app.routes.media_routes import resolve_media_path
 
 from app.models.detection import (
     DetectionResult,
+    DetectionStreamMessage,
     DetectRequest,
     DetectResponse,
     ParkingViolation,
@@ -19,9 +22,92 @@ from app.services.tracker_service import TrackerManager
 from app.services.zone_service import ZoneService
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
+import orjson
+from pydantic import BaseModel
 
 router = APIRouter(prefix="/detection", tags=["detection"])
 
+# màu bbox theo class_id COCO (xem VEHICLE_CLASSES), tra bằng index thay vì dict
+_DEFAULT_COLOR = (0, 255, 0)
+_COLOR_BY_CLASS_ID = (
+    (255, 136, 0),  # 0 person
+    (255, 255, 0),  # 1 bicycle
+    (0, 255, 0),  # 2 car
+    (0, 255, 255),  # 3 motorcycle
+    _DEFAULT_COLOR,  # 4
+    (0, 136, 255),  # 5 bus
+    _DEFAULT_COLOR,  # 6
+    (255, 0, 255),  # 7 truck
+)
+
+# Bỏ qua YOLO khi frame gần như không đổi (camera tĩnh): so sánh ảnh xám 32x32,
+# chênh lệch trung bình < ngưỡng thì dùng lại kết quả cũ, tối đa N frame liên tiếp
+_STATIC_SIG_SIZE = (32, 32)
+_STATIC_MEAN_DIFF = 2.0
+_MAX_REUSED_FRAMES = 10
+
+# số lần cap.grab() thử lại khi đọc lỗi trước khi mở lại capture
+_GRAB_RETRIES = 3
+
+# nhịp gửi frame: theo FPS của nguồn, không nhanh hơn _MAX_STREAM_FPS;
+# nguồn không báo FPS => 50ms/frame như trước
+_DEFAULT_FRAME_INTERVAL = 0.05
+_MAX_STREAM_FPS = 30.0
+
+
+def _frame_interval(cap) -> float:
+    import cv2
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not (0 < fps <= 1000):  # 0 / NaN / giá trị rác
+        return _DEFAULT_FRAME_INTERVAL
+    return 1.0 / min(fps, _MAX_STREAM_FPS)
+
+@functools.lru_cache(maxsize=256)
+def _label_size(label: str) -> tuple[int, int]:
+    # kích thước chỉ phụ thuộc text (font/scale/thickness cố định) => memoize
+    import cv2
+
+    return cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
+
+
+@functools.cache
+def _jpeg_encoder():
+    # PyTurboJPEG (libjpeg-turbo trực tiếp, SIMD) nếu có, không thì dùng cv2
+    try:
+        from turbojpeg import TurboJPEG
+
+        tj = TurboJPEG()
+        return lambda frame, quality: tj.encode(frame, quality=quality)
+    except Exception:
+        import cv2
+
+        def _cv2_encode(frame, quality):
+            _, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            return buf.tobytes()
+
+        return _cv2_encode
+
+
+def _encode_jpeg(frame, quality: int) -> bytes:
+    return _jpeg_encoder()(frame, quality)
+
+
+async def _send_json(websocket: WebSocket, data: dict) -> None:
+    # orjson thay json.dumps của Starlette; vẫn gửi text frame vì binary frame
+    # dành cho ảnh JPEG của video stream
+    await websocket.send_text(orjson.dumps(data).decode())
+
+
+def _open_capture(source: str):
+    import cv2
+
+    # backend FFmpeg + buffer 1 frame => luôn đọc frame mới nhất, ít trễ
+    cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
 def _resolve_video_url(video_url: str) -> str:
     try:
         parsed = urlparse(video_url)
@@ -56,16 +142,25 @@ async def detect_vehicles(request: DetectRequest):
                 result.detections, zones, request.camera_id
             )
 
-        return DetectResponse(success=True, result=result, violations=violations)
+        # result/violations do service tạo ra => không cần validate lại
+        return DetectResponse.model_construct(
+            success=True, result=result, violations=violations
+        )
     except Exception as e:
         return DetectResponse(success=False, error=str(e))
 
 
-import base64
+def _decode_b64_to_frame(base64_data: str):
+    # cv2/numpy chỉ cần cho route này và video stream => import khi dùng
+    import base64
 
-import cv2
-import numpy as np
-from pydantic import BaseModel
+    import cv2
+    import numpy as np
+
+    # bỏ prefix data URL ("data:image/jpeg;base64,") nếu có
+    base64_data = base64_data.partition(",")[2] or base64_data
+    nparr = np.frombuffer(base64.b64decode(base64_data), np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
 
 class DetectBase64Request(BaseModel):
@@ -77,13 +172,7 @@ class DetectBase64Request(BaseModel):
 @router.post("/detect-base64", response_model=DetectResponse)
 async def detect_vehicles_base64(request: DetectBase64Request):
     try:
-        base64_data = request.image_base64
-        if "," in base64_data:
-            base64_data = base64_data.split(",")[1]
-
-        image_bytes = base64.b64decode(base64_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        frame = await asyncio.to_thread(_decode_b64_to_frame, request.image_base64)
 
         if frame is None:
             return DetectResponse(success=False, error="Failed to decode image")
@@ -104,7 +193,10 @@ async def detect_vehicles_base64(request: DetectBase64Request):
                 result.detections, zones, request.camera_id
             )
 
-        return DetectResponse(success=True, result=result, violations=violations)
+        # result/violations do service tạo ra => không cần validate lại
+        return DetectResponse.model_construct(
+            success=True, result=result, violations=violations
+        )
     except Exception as e:
         return DetectResponse(success=False, error=str(e))
 
@@ -134,7 +226,10 @@ async def detect_from_video(request: DetectVideoRequest):
                 result.detections, zones, request.camera_id
             )
 
-        return DetectResponse(success=True, result=result, violations=violations)
+        # result/violations do service tạo ra => không cần validate lại
+        return DetectResponse.model_construct(
+            success=True, result=result, violations=violations
+        )
     except Exception as e:
         return DetectResponse(success=False, error=str(e))
 
@@ -192,7 +287,7 @@ async def get_traffic_stats(camera_id: str, image_url: str):
     )
     occupancy = await DetectionService.get_zones_occupancy(result.detections, zones)
 
-    return TrafficStats(
+    return TrafficStats.model_construct(
         camera_id=camera_id,
         timestamp=datetime.now().isoformat(),
         vehicle_counts=result.vehicle_count,
@@ -204,29 +299,28 @@ async def get_traffic_stats(camera_id: str, image_url: str):
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: dict[str, list[WebSocket]] = {}
+        self.active_connections: dict[str, set[WebSocket]] = {}
 
     async def connect(self, websocket: WebSocket, camera_id: str):
         await websocket.accept()
         if camera_id not in self.active_connections:
-            self.active_connections[camera_id] = []
-        self.active_connections[camera_id].append(websocket)
+            self.active_connections[camera_id] = set()
+        self.active_connections[camera_id].add(websocket)
 
     def disconnect(self, websocket: WebSocket, camera_id: str):
         if camera_id in self.active_connections:
-            if websocket in self.active_connections[camera_id]:
-                self.active_connections[camera_id].remove(websocket)
+            self.active_connections[camera_id].discard(websocket)
 
     async def broadcast(self, camera_id: str, message: dict):
         if camera_id in self.active_connections:
-            dead = []
-            for connection in self.active_connections[camera_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    dead.append(connection)
-            for conn in dead:
-                self.disconnect(conn, camera_id)
+            # gửi song song tới mọi client, client chậm không chặn client khác
+            conns = list(self.active_connections[camera_id])
+            results = await asyncio.gather(
+                *(_send_json(c, message) for c in conns), return_exceptions=True
+            )
+            for conn, r in zip(conns, results):
+                if isinstance(r, Exception):
+                    self.disconnect(conn, camera_id)
 
 
 manager = ConnectionManager()
@@ -243,7 +337,7 @@ async def detection_stream(websocket: WebSocket, camera_id: str):
             if data.get("type") == "detect":
                 image_url = data.get("image_url")
                 if not image_url:
-                    await websocket.send_json({"error": "image_url required"})
+                    await _send_json(websocket, {"error": "image_url required"})
                     continue
 
                 result = await DetectionService.detect_from_url(
@@ -256,21 +350,19 @@ async def detection_stream(websocket: WebSocket, camera_id: str):
                         result.detections, zones, camera_id
                     )
 
-                    await websocket.send_json(
-                        {
-                            "type": "detection_result",
-                            "result": result.model_dump(),
-                            "violations": [v.model_dump() for v in violations],
-                            "timestamp": datetime.now().isoformat(),
-                        }
+                    message = DetectionStreamMessage.model_construct(
+                        result=result,
+                        violations=violations,
+                        timestamp=datetime.now().isoformat(),
                     )
+                    await websocket.send_text(message.model_dump_json())
                 else:
-                    await websocket.send_json(
-                        {"type": "error", "error": "Detection failed"}
+                    await _send_json(
+                        websocket, {"type": "error", "error": "Detection failed"}
                     )
 
             elif data.get("type") == "ping":
-                await websocket.send_json({"type": "pong"})
+                await _send_json(websocket, {"type": "pong"})
 
     except WebSocketDisconnect:
         manager.disconnect(websocket, camera_id)
@@ -282,71 +374,130 @@ async def detection_stream(websocket: WebSocket, camera_id: str):
 async def video_detection_stream(websocket: WebSocket, camera_id: str):
     await websocket.accept()
 
+    reader_task = None
+    cap = None
     try:
         data = await websocket.receive_json()
         video_url = data.get("video_url")
         send_frame = data.get("send_frame", True)
 
         if not video_url:
-            await websocket.send_json({"type": "error", "error": "video_url required"})
+            await _send_json(
+                websocket, {"type": "error", "error": "video_url required"}
+            )
             await websocket.close()
             return
 
         import cv2
+        import numpy as np
 
-        cap = cv2.VideoCapture(_resolve_video_url(video_url))
+        source = _resolve_video_url(video_url)
+        cap = await asyncio.to_thread(_open_capture, source)
 
         if not cap.isOpened():
-            await websocket.send_json(
-                {"type": "error", "error": "Failed to open video stream"}
+            await _send_json(
+                websocket, {"type": "error", "error": "Failed to open video stream"}
             )
             await websocket.close()
             return
 
-        await websocket.send_json(
-            {"type": "connected", "message": "Video stream connected"}
+        await _send_json(
+            websocket, {"type": "connected", "message": "Video stream connected"}
         )
 
+        def _build_zone_draw_cache(zones: list[ZonePolygon]) -> dict:
+            # zone.id -> (pts int32, vị trí label); chỉ tính lại khi zones đổi
+            return {
+                z.id: (
+                    np.asarray([(p.x, p.y) for p in z.points], dtype=np.int32),
+                    (int(z.points[0].x), int(z.points[0].y) - 10),
+                )
+                for z in zones
+                if len(z.points) >= 3
+            }
+
         zones = await ZoneService.get_zones(camera_id)
+        zone_draw_cache = _build_zone_draw_cache(zones)
+        # Traffic light map for stop line zones (cùng object với zones nên
+        # thấy được is_red_light cập nhật mỗi frame)
+        traffic_light_map = {z.id: z for z in zones if z.is_traffic_light}
+
+        font = cv2.FONT_HERSHEY_SIMPLEX
+
+        # Đọc control message (stop / update_zones) ở task riêng, vòng chính
+        # chỉ lấy từ queue => không tạo/huỷ Task mỗi frame như wait_for
+        control_q: asyncio.Queue = asyncio.Queue()
+
+        async def _read_control():
+            try:
+                while True:
+                    control_q.put_nowait(await websocket.receive_json())
+            except Exception:
+                # client ngắt kết nối hoặc gửi message lỗi => dừng stream
+                control_q.put_nowait({"type": "stop"})
 
-        CLASS_COLORS = {
-            "car": (0, 255, 0),
-            "motorcycle": (0, 255, 255),
-            "bus": (0, 136, 255),
-            "truck": (255, 0, 255),
-            "bicycle": (255, 255, 0),
-            "person": (255, 136, 0),
-        }
+        reader_task = asyncio.create_task(_read_control())
+
+        prev_sig = None
+        prev_result = None
+        reused_frames = 0
+        frame_interval = _frame_interval(cap)
 
         while True:
+            frame_start = time.monotonic()
             try:
-                msg = await asyncio.wait_for(websocket.receive_json(), timeout=0.01)
+                msg = control_q.get_nowait()
+            except asyncio.QueueEmpty:
+                msg = None
+
+            if msg is not None:
                 if msg.get("type") == "stop":
                     break
                 if msg.get("type") == "update_zones":
                     zones = await ZoneService.get_zones(camera_id)
-            except asyncio.TimeoutError:
-                pass
-            except:
-                break
+                    zone_draw_cache = _build_zone_draw_cache(zones)
+                    traffic_light_map = {z.id: z for z in zones if z.is_traffic_light}
 
-            ret, frame = cap.read()
+            # cap.read() chặn trên I/O mạng (HLS/RTSP) => chạy ở thread riêng
+            ret, frame = await asyncio.to_thread(cap.read)
             if not ret:
-                cap.release()
-                cap = cv2.VideoCapture(_resolve_video_url(video_url))
-                await asyncio.sleep(0.5)
+                # lỗi mạng thoáng qua: thử grab lại (backoff) trước khi mở lại
+                # capture, vì mở lại HLS/RTSP phải handshake từ đầu
+                for attempt in range(_GRAB_RETRIES):
+                    await asyncio.sleep(0.1 * (attempt + 1))
+                    if await asyncio.to_thread(cap.grab):
+                        break
+                else:
+                    cap.release()
+                    cap = await asyncio.to_thread(_open_capture, source)
+                    frame_interval = _frame_interval(cap)
+                    await asyncio.sleep(0.5)
                 continue
 
-            result = await DetectionService.detect_from_frame(
-                frame=frame, camera_id=camera_id, use_tracking=True
-            )
+            small = cv2.resize(frame, _STATIC_SIG_SIZE, interpolation=cv2.INTER_AREA)
+            sig = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+            if (
+                prev_result is not None
+                and reused_frames < _MAX_REUSED_FRAMES
+                and np.abs(sig - prev_sig).mean() < _STATIC_MEAN_DIFF
+            ):
+                result = prev_result
+                reused_frames += 1
+            else:
+                result = await DetectionService.detect_from_frame(
+                    frame=frame, camera_id=camera_id, use_tracking=True
+                )
+                prev_sig, prev_result = sig, result
+                reused_frames = 0
 
             if result:
                 # Auto-detect traffic light color for each zone
                 for zone in zones:
                     if zone.is_traffic_light:
+                        # dùng lại pts int32 của zone_draw_cache (zone < 3 điểm không có trong cache)
+                        cached = zone_draw_cache.get(zone.id)
                         detected_color = DetectionService.detect_traffic_light_color(
-                            frame, zone.points
+                            frame, cached[0] if cached is not None else zone.points
                         )
                         if detected_color == "red":
                             zone.is_red_light = True
@@ -355,156 +506,152 @@ async def video_detection_stream(websocket: WebSocket, camera_id: str):
                         # If yellow/unknown, keep previous state or default (False)
                         # We could add an is_yellow_light state if needed
 
-                violations = await DetectionService.check_parking_violations(
-                    result.detections, zones, camera_id
-                )
-                red_light_violations = (
-                    await DetectionService.check_red_light_violations(
+                # parking + vượt đèn đỏ chung 1 ma trận detection x zone
+                violations, red_light_violations, _ = (
+                    await DetectionService.check_violations(
                         result.detections, zones, camera_id
                     )
                 )
 
-                violation_ids = set(v.track_id for v in violations)
-                red_light_ids = set(v.track_id for v in red_light_violations)
+                # Overlay chỉ cần khi client nhận frame (send_frame=True)
+                if send_frame:
+                    violation_ids = {v.track_id for v in violations}
+                    red_light_ids = {v.track_id for v in red_light_violations}
+
+                    for zone in zones:
+                        cached = zone_draw_cache.get(zone.id)
+                        if cached is not None:
+                            pts, label_origin = cached
+                            if zone.is_traffic_light:
+                                if zone.is_red_light:
+                                    color = (0, 0, 255)  # Red
+                                    status_text = "RED"
+                                else:
+                                    color = (0, 255, 0)  # Green
+                                    status_text = "GREEN"
+
+                                cv2.polylines(frame, [pts], True, color, 3)
+                                label = f"🚦 {zone.name} {status_text}"
+                                cv2.putText(
+                                    frame,
+                                    label,
+                                    label_origin,
+                                    font,
+                                    0.7,
+                                    color,
+                                    2,
+                                )
+                            elif zone.is_stop_line:
+                                # Stop line zone - color based on linked traffic light
+                                linked_light = traffic_light_map.get(
+                                    zone.linked_traffic_light_id
+                                )
+                                if linked_light and linked_light.is_red_light:
+                                    color = (0, 0, 255)  # Red - danger zone
+                                    status_text = "STOP!"
+                                else:
+                                    color = (255, 255, 255)  # White - safe to cross
+                                    status_text = "GO"
+
+                                # Draw dashed line for stop line
+                                cv2.polylines(frame, [pts], True, color, 3)
+                                label = f"🚧 {zone.name} [{status_text}]"
+                                cv2.putText(
+                                    frame,
+                                    label,
+                                    label_origin,
+                                    font,
+                                    0.6,
+                                    color,
+                                    2,
+                                )
+                            else:
+                                color = (0, 0, 255) if zone.is_parking_zone else (0, 255, 0)
+                                cv2.polylines(frame, [pts], True, color, 2)
+                                cv2.putText(
+                                    frame,
+                                    zone.name,
+                                    label_origin,
+                                    font,
+                                    0.6,
+                                    color,
+                                    2,
+                                )
+
+                    for det in result.detections:
+                        is_parking_violation = det.track_id in violation_ids
+                        is_red_light_violation = det.track_id in red_light_ids
+                        is_violation = is_parking_violation or is_red_light_violation
+
+                        if is_red_light_violation:
+                            color = (0, 0, 255)
+                        elif is_parking_violation:
+                            color = (0, 100, 255)
+                        else:
+                            color = _COLOR_BY_CLASS_ID[det.class_id]
 
-                # Build traffic light map for stop line zones
-                traffic_light_map = {z.id: z for z in zones if z.is_traffic_light}
+                        x1, y1 = int(det.bbox.x1), int(det.bbox.y1)
+                        x2, y2 = int(det.bbox.x2), int(det.bbox.y2)
 
-                for zone in zones:
-                    if len(zone.points) >= 3:
-                        pts = np.array(
-                            [[int(p.x), int(p.y)] for p in zone.points], np.int32
+                        cv2.rectangle(
+                            frame, (x1, y1), (x2, y2), color, 2 if not is_violation else 3
                         )
-                        if zone.is_traffic_light:
-                            if zone.is_red_light:
-                                color = (0, 0, 255)  # Red
-                                status_text = "RED"
-                            else:
-                                color = (0, 255, 0)  # Green
-                                status_text = "GREEN"
-
-                            cv2.polylines(frame, [pts], True, color, 3)
-                            label = f"🚦 {zone.name} {status_text}"
-                            cv2.putText(
-                                frame,
-                                label,
-                                (int(zone.points[0].x), int(zone.points[0].y) - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                0.7,
-                                color,
-                                2,
-                            )
-                        elif zone.is_stop_line:
-                            # Stop line zone - color based on linked traffic light
-                            linked_light = traffic_light_map.get(
-                                zone.linked_traffic_light_id
-                            )
-                            if linked_light and linked_light.is_red_light:
-                                color = (0, 0, 255)  # Red - danger zone
-                                status_text = "STOP!"
-                            else:
-                                color = (255, 255, 255)  # White - safe to cross
-                                status_text = "GO"
-
-                            # Draw dashed line for stop line
-                            cv2.polylines(frame, [pts], True, color, 3)
-                            label = f"🚧 {zone.name} [{status_text}]"
-                            cv2.putText(
-                                frame,
-                                label,
-                                (int(zone.points[0].x), int(zone.points[0].y) - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                0.6,
-                                color,
-                                2,
-                            )
-                        else:
-                            color = (0, 0, 255) if zone.is_parking_zone else (0, 255, 0)
-                            cv2.polylines(frame, [pts], True, color, 2)
-                            cv2.putText(
-                                frame,
-                                zone.name,
-                                (int(zone.points[0].x), int(zone.points[0].y) - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                0.6,
-                                color,
-                                2,
-                            )
-
-                for det in result.detections:
-                    is_parking_violation = det.track_id in violation_ids
-                    is_red_light_violation = det.track_id in red_light_ids
-                    is_violation = is_parking_violation or is_red_light_violation
-
-                    if is_red_light_violation:
-                        color = (0, 0, 255)
-                    elif is_parking_violation:
-                        color = (0, 100, 255)
-                    else:
-                        color = CLASS_COLORS.get(det.class_name, (0, 255, 0))
-
-                    x1, y1 = int(det.bbox.x1), int(det.bbox.y1)
-                    x2, y2 = int(det.bbox.x2), int(det.bbox.y2)
-
-                    cv2.rectangle(
-                        frame, (x1, y1), (x2, y2), color, 2 if not is_violation else 3
-                    )
 
-                    label = (
-                        f"#{det.track_id} {det.class_name}"
-                        if det.track_id
-                        else det.class_name
-                    )
-                    if is_red_light_violation:
-                        label = f"⚠️ RED LIGHT! {label}"
-                    label_size, _ = cv2.getTextSize(
-                        label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2
-                    )
-                    cv2.rectangle(
-                        frame,
-                        (x1, y1 - label_size[1] - 10),
-                        (x1 + label_size[0], y1),
-                        color,
-                        -1,
-                    )
-                    cv2.putText(
-                        frame,
-                        label,
-                        (x1, y1 - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.5,
-                        (0, 0, 0),
-                        2,
-                    )
+                        label = (
+                            f"#{det.track_id} {det.class_name}"
+                            if det.track_id
+                            else det.class_name
+                        )
+                        if is_red_light_violation:
+                            label = f"⚠️ RED LIGHT! {label}"
+                        label_size = _label_size(label)
+                        cv2.rectangle(
+                            frame,
+                            (x1, y1 - label_size[1] - 10),
+                            (x1 + label_size[0], y1),
+                            color,
+                            -1,
+                        )
+                        cv2.putText(
+                            frame,
+                            label,
+                            (x1, y1 - 5),
+                            font,
+                            0.5,
+                            (0, 0, 0),
+                            2,
+                        )
 
-                response_data = {
-                    "type": "detection_result",
-                    "result": result.model_dump(),
-                    "violations": [v.model_dump() for v in violations],
-                    "red_light_violations": [
-                        v.model_dump() for v in red_light_violations
-                    ],
-                    "timestamp": datetime.now().isoformat(),
-                }
+                # serialize thẳng ra JSON (pydantic-core), bỏ bước model_dump -> json.dumps
+                message = DetectionStreamMessage.model_construct(
+                    result=result,
+                    violations=violations,
+                    red_light_violations=red_light_violations,
+                    timestamp=datetime.now().isoformat(),
+                )
+                await websocket.send_text(message.model_dump_json())
 
                 if send_frame:
-                    _, buffer = cv2.imencode(
-                        ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 70]
-                    )
-                    frame_base64 = base64.b64encode(buffer).decode("utf-8")
-                    response_data["frame"] = f"data:image/jpeg;base64,{frame_base64}"
-
-                await websocket.send_json(response_data)
+                    # frame gửi riêng dạng binary (JPEG thô) ngay sau metadata
+                    jpeg = await asyncio.to_thread(_encode_jpeg, frame, 70)
+                    await websocket.send_bytes(jpeg)
 
-            await asyncio.sleep(0.05)
+            # giữ nhịp theo FPS nguồn: frame dùng lại kết quả (camera tĩnh) hay file local
+            # đọc rất nhanh => không đẩy JSON + JPEG nhanh hơn thời gian thực
+            await asyncio.sleep(max(0.0, frame_interval - (time.monotonic() - frame_start)))
 
-        cap.release()
         await websocket.close()
 
     except WebSocketDisconnect:
         pass
     except Exception as e:
         try:
-            await websocket.send_json({"type": "error", "error": str(e)})
+            await _send_json(websocket, {"type": "error", "error": str(e)})
         except:
             pass
+    finally:
+        if reader_task is not None:
+            reader_task.cancel()
+        # client ngắt / lỗi giữa vòng lặp cũng phải nhả capture (FFmpeg handle, kết nối)
+        if cap is not None:
+            cap.release()
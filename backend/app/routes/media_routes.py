@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import glob
 import os
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import FileResponse
@@ -10,7 +9,7 @@ from app.core.config import settings
 router = APIRouter()
 
 
-def _upload_dir() -> str:
+def _resolve_upload_dir() -> str:
     p = os.path.normpath(settings.UPLOAD_DIR)
     if not os.path.isabs(p):
         p = os.path.normpath(os.path.join(os.getcwd(), p))
@@ -18,16 +17,38 @@ def _upload_dir() -> str:
     return p
 
 
+# thư mục upload không đổi khi chạy => chỉ normalize + makedirs một lần lúc import
+_UPLOAD_DIR = _resolve_upload_dir()
+
+
+def _upload_dir() -> str:
+    return _UPLOAD_DIR
+
+
+_MEDIA_CACHE_CONTROL = "public, max-age=86400"
+
+# media_id -> path, điền khi upload để khỏi phải quét thư mục
+_media_paths: dict[str, str] = {}
+
+
+def remember_media_path(media_id: str, path: str) -> None:
+    _media_paths[media_id] = path
+
+
 def resolve_media_path(media_id: str) -> str | None:
+    p = _media_paths.get(media_id)
+    if p is not None:
+        if os.path.isfile(p):
+            return p
+        del _media_paths[media_id]
+
     up = _upload_dir()
-    # hỗ trợ id.* (id.mp4, id.jpg...)
-    matches = glob.glob(os.path.join(up, f"{media_id}.*"))
-    if matches:
-        return matches[0]
-    # fallback nếu lưu thẳng file không có ext
-    p2 = os.path.join(up, media_id)
-    if os.path.exists(p2):
-        return p2
+    # hỗ trợ id.* (id.mp4, id.jpg...) và file lưu thẳng không có ext
+    with os.scandir(up) as it:
+        for e in it:
+            if e.name.partition(".")[0] == media_id and e.is_file():
+                _media_paths[media_id] = e.path
+                return e.path
     return None
 
 
@@ -36,4 +57,5 @@ async def get_media(media_id: str):
     path = resolve_media_path(media_id)
     if not path:
         raise HTTPException(status_code=404, detail="Media not found")
-    return FileResponse(path)
+    # FileResponse => sendfile(2), kernel đẩy thẳng page cache ra socket; id theo nội dung nên cache được
+    return FileResponse(path, headers={"Cache-Control": _MEDIA_CACHE_CONTROL})
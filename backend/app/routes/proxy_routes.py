@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Response
+import asyncio
+import re
+
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse, PlainTextResponse
 import httpx
 from urllib.parse import urlparse, urljoin, quote
 
+from app.core.admission import upstream_admission
+
 router = APIRouter(prefix="/proxy", tags=["proxy"])
 
+# #EXT-X-KEY:...URI="..." (hoặc '...')
+_KEY_URI_RE = re.compile(r"""^([ \t]*#EXT-X-KEY[^\n]*?URI=)(["'])(.*?)\2""", re.M)
+# dòng segment / sub-playlist: không rỗng, không bắt đầu bằng '#'
+_SEG_LINE_RE = re.compile(r"^[ \t]*([^#\s][^\r\n]*?)[ \t\r]*$", re.M)
+
 def _validate_url(url: str) -> str:
     try:
         u = urlparse(url)
@@ -14,109 +24,188 @@ def _validate_url(url: str) -> str:
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid URL")
 
+# ảnh camera cập nhật liên tục => cho cache ngắn; segment .ts không bao giờ đổi
+_IMAGE_CACHE_CONTROL = "public, max-age=5"
+_SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _conditional_headers(request: Request) -> dict[str, str]:
+    # chuyển If-None-Match / If-Modified-Since của browser lên upstream
+    return {
+        k: v
+        for k in ("if-none-match", "if-modified-since")
+        if (v := request.headers.get(k))
+    }
+
+
+def _validator_headers(resp: httpx.Response) -> dict[str, str]:
+    return {
+        k: v for k in ("etag", "last-modified") if (v := resp.headers.get(k))
+    }
+
+
+class _UpstreamStreamingResponse(StreamingResponse):
+    """
+    Stream body của response upstream (client.send(stream=True)) về client, đang giữ 1 slot admission.
+    Đóng resp + trả slot đúng 1 lần: khi stream xong, hoặc khi response kết thúc vì bất kỳ lý do gì
+    (client ngắt trước khi generator kịp chạy => finally của generator không bao giờ chạy).
+    """
+
+    def __init__(self, upstream: httpx.Response, chunk_size: int | None = None, **kwargs):
+        self._upstream = upstream
+        self._chunk_size = chunk_size
+        self._released = False
+        super().__init__(self._iter_upstream(), **kwargs)
+
+    async def _iter_upstream(self):
+        try:
+            async for chunk in self._upstream.aiter_bytes(chunk_size=self._chunk_size):
+                yield chunk
+        finally:
+            # stream xong => trả slot ngay, không đợi gửi xong response
+            await self._release()
+
+    async def _release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        try:
+            await self._upstream.aclose()
+        finally:
+            await upstream_admission.release()
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # shield: task request bị cancel (shutdown) vẫn trả được slot
+            await asyncio.shield(self._release())
+
+
 @router.get("/image")
-async def proxy_image(url: str):
+async def proxy_image(request: Request, url: str):
     _validate_url(url)
-    async with httpx.AsyncClient(follow_redirects=True, timeout=20) as client:
-        r = await client.get(url, headers={"User-Agent": "Mozilla/5.0"})
-    if r.status_code != 200:
-        raise HTTPException(status_code=r.status_code, detail="Upstream error")
+    client: httpx.AsyncClient = request.app.state.http
+    req = client.build_request(
+        "GET",
+        url,
+        headers={"User-Agent": "Mozilla/5.0", **_conditional_headers(request)},
+    )
+    # giữ 1 slot tới khi stream xong (hoặc lỗi)
+    await upstream_admission.acquire()
+    try:
+        resp = await client.send(req, stream=True)
+    except BaseException:
+        await upstream_admission.release()
+        raise
+
+    if resp.status_code == 304:
+        # browser đã có bản mới nhất => không gửi lại body
+        await resp.aclose()
+        await upstream_admission.release()
+        return Response(
+            status_code=304,
+            headers={
+                "Access-Control-Allow-Origin": "*",
+                "Cache-Control": _IMAGE_CACHE_CONTROL,
+                **_validator_headers(resp),
+            },
+        )
 
-    return Response(
-        content=r.content,
-        media_type=r.headers.get("content-type", "image/jpeg"),
+    if resp.status_code != 200:
+        await resp.aclose()
+        await upstream_admission.release()
+        raise HTTPException(status_code=resp.status_code, detail="Upstream error")
+
+    # stream thẳng về client, không giữ cả ảnh trong RAM
+    return _UpstreamStreamingResponse(
+        resp,
+        chunk_size=65536,
+        media_type=resp.headers.get("content-type", "image/jpeg"),
         headers={
             "Access-Control-Allow-Origin": "*",
-            "Cache-Control": "no-cache",
+            "Cache-Control": _IMAGE_CACHE_CONTROL,
+            **_validator_headers(resp),
         },
     )
 
 @router.get("/hls")
-async def proxy_hls_playlist(url: str):
+async def proxy_hls_playlist(request: Request, url: str):
     """
     Proxy file .m3u8 và rewrite mọi URI trong playlist để trỏ về /api/proxy/hls/segment
     """
     _validate_url(url)
 
-    async with httpx.AsyncClient(follow_redirects=True, timeout=20) as client:
+    client: httpx.AsyncClient = request.app.state.http
+    async with upstream_admission:
         r = await client.get(url, headers={"User-Agent": "Mozilla/5.0"})
     if r.status_code != 200:
         raise HTTPException(status_code=r.status_code, detail="Upstream error")
 
-    text = r.text
     base_url = url
-
-    out_lines = []
-    for line in text.splitlines():
-        s = line.strip()
-
-        # comment / directive
-        if not s or s.startswith("#"):
-            # rewrite EXT-X-KEY URI nếu có
-            if "URI=" in s and s.startswith("#EXT-X-KEY"):
-                try:
-                    pre, rest = line.split("URI=", 1)
-                    q = '"' if '"' in rest else "'"
-                    a = rest.find(q)
-                    b = rest.find(q, a + 1)
-                    uri_val = rest[a + 1 : b]
-                    abs_uri = urljoin(base_url, uri_val)
-                    proxied = f'/api/proxy/hls/segment?url={quote(abs_uri, safe="")}'
-                    out_lines.append(pre + 'URI="' + proxied + '"' + rest[b + 1 :])
-                    continue
-                except Exception:
-                    pass
-
-            out_lines.append(line)
-            continue
-
-        # segment / sub-playlist
-        abs_uri = urljoin(base_url, s)
-        proxied = f"/api/proxy/hls/segment?url={quote(abs_uri, safe='')}"
-        out_lines.append(proxied)
+    proxied_cache: dict[str, str] = {}
+
+    def _proxied(uri: str) -> str:
+        # playlist VOD lặp lại nhiều URI => cache urljoin + quote theo chuỗi gốc
+        p = proxied_cache.get(uri)
+        if p is None:
+            abs_uri = urljoin(base_url, uri)
+            p = f"/api/proxy/hls/segment?url={quote(abs_uri, safe='')}"
+            proxied_cache[uri] = p
+        return p
+
+    # rewrite EXT-X-KEY URI, rồi tới các dòng segment / sub-playlist
+    text = _KEY_URI_RE.sub(
+        lambda m: m.group(1) + '"' + _proxied(m.group(3)) + '"', r.text
+    )
+    text = _SEG_LINE_RE.sub(lambda m: _proxied(m.group(1)), text)
 
     return PlainTextResponse(
-        "\n".join(out_lines), 
+        text,
         media_type="application/vnd.apple.mpegurl",
         headers={
             "Access-Control-Allow-Origin": "*",
             "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
         },
     )
 
 @router.get("/hls/segment")
-async def proxy_hls_segment(url: str):
+async def proxy_hls_segment(request: Request, url: str):
     _validate_url(url)
 
-    client = httpx.AsyncClient(follow_redirects=True, timeout=30)
+    # client dùng chung (app.state.http) => chỉ đóng response, không đóng client
+    client: httpx.AsyncClient = request.app.state.http
+    req = client.build_request(
+        "GET", url, headers={"User-Agent": "Mozilla/5.0"}, timeout=30
+    )
+    await upstream_admission.acquire()
     try:
-        req = client.build_request("GET", url, headers={"User-Agent": "Mozilla/5.0"})
         resp = await client.send(req, stream=True)
-
-        if resp.status_code != 200:
-            await resp.aclose()
-            await client.aclose()
-            raise HTTPException(status_code=resp.status_code, detail="Upstream error")
-
-        content_type = resp.headers.get("content-type", "application/octet-stream")
-
-        async def iter_bytes():
-            try:
-                async for chunk in resp.aiter_bytes():
-                    yield chunk
-            finally:
-                # đóng stream + client khi stream xong
-                await resp.aclose()
-                await client.aclose()
-
-        return StreamingResponse(
-            iter_bytes(), 
-            media_type=content_type,
-            headers={
-                "Access-Control-Allow-Origin": "*",
-            }
-        )
-
     except httpx.RequestError as e:
-        await client.aclose()
+        await upstream_admission.release()
         raise HTTPException(status_code=502, detail=f"Proxy error: {e}")
+    except BaseException:
+        await upstream_admission.release()
+        raise
+
+    if resp.status_code != 200:
+        await resp.aclose()
+        await upstream_admission.release()
+        raise HTTPException(status_code=resp.status_code, detail="Upstream error")
+
+    content_type = resp.headers.get("content-type", "application/octet-stream")
+    # sub-playlist cũng đi qua endpoint này => chỉ segment mới cache vĩnh viễn
+    is_playlist = "mpegurl" in content_type.lower() or urlparse(
+        url
+    ).path.lower().endswith(".m3u8")
+
+    # đóng stream + trả slot admission khi stream xong hoặc client ngắt
+    return _UpstreamStreamingResponse(
+        resp,
+        media_type=content_type,
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Cache-Control": "no-cache" if is_playlist else _SEGMENT_CACHE_CONTROL,
+        }
+    )
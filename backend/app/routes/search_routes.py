@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
 from app.services.search_service import SearchService
 
 router = APIRouter()
@@ -9,6 +9,7 @@ svc = SearchService()
 
 @router.post("/search")
 async def search(
+    request: Request,
     text: str | None = Form(default=None),
     url: str | None = Form(default=None),
     files: list[UploadFile] = File(default=[]),
@@ -21,7 +22,7 @@ async def search(
     if not (text or url or files):
         raise HTTPException(status_code=400, detail="Provide text/url or upload file(s)")
 
-    return await svc.handle(text=text, url=url, files=files)
+    return await svc.handle(text=text, url=url, files=files, http=request.app.state.http)
 
 
 @router.get("/search/jobs/{job_id}")
@@ -1,26 +1,40 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import contextlib
+import hashlib
 import os
 import re
-import shutil
 import uuid
-from typing import Any
+from collections import Counter
+from functools import lru_cache
+from typing import Annotated, Any, Literal
+from urllib.parse import urlsplit
 
 import cv2
 import httpx
 import numpy as np
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from pydantic import BaseModel
-from urllib.parse import urlparse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response
+from pydantic import BaseModel, BeforeValidator
 
+from app.core.admission import upstream_admission
 from app.core.config import settings
-from app.routes.media_routes import resolve_media_path
+from app.routes.media_routes import remember_media_path, resolve_media_path
+from app.models.detection import DetectionResult
 from app.services.detection_service import DetectionService
 
+try:
+    # pybase64 không bắt buộc: có thì encode base64 bằng SIMD (AVX2/NEON), không thì stdlib
+    from pybase64 import b64encode_as_string as _b64encode_str
+except ImportError:
+    def _b64encode_str(data) -> str:
+        return base64.b64encode(data).decode("ascii")
+
 router = APIRouter()
 
 
+@lru_cache(maxsize=1)  # makedirs chỉ cần chạy lần đầu
 def _upload_dir() -> str:
     p = os.path.normpath(settings.UPLOAD_DIR)
     if not os.path.isabs(p):
@@ -29,68 +43,180 @@ def _upload_dir() -> str:
     return p
 
 
-def _public_base_url() -> str:
-    # nếu bạn deploy khác host: set env PUBLIC_BASE_URL
-    return os.getenv("PUBLIC_BASE_URL", "http://localhost:8000").rstrip("/")
+# nếu bạn deploy khác host: set env PUBLIC_BASE_URL
+_PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000").rstrip("/")
+
+
+_IMG_EXTS = frozenset({".jpg", ".jpeg", ".png", ".webp", ".bmp"})
 
 
 def _is_image_ext(name: str) -> bool:
-    n = (name or "").lower()
-    return any(n.endswith(x) for x in [".jpg", ".jpeg", ".png", ".webp", ".bmp"])
+    return os.path.splitext(name or "")[1].lower() in _IMG_EXTS
 
 
-def _draw_and_encode_jpeg(frame_bgr: np.ndarray, dets: list[dict[str, Any]]) -> dict[str, Any] | None:
-    img = frame_bgr.copy()
-    h, w = img.shape[:2]
+# encode nhanh: không tối ưu Huffman, không progressive
+_JPEG_PARAMS = [
+    cv2.IMWRITE_JPEG_QUALITY, 75,
+    cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+    cv2.IMWRITE_JPEG_PROGRESSIVE, 0,
+]
 
-    for d in dets:
-        label = str(d.get("label", "obj"))
-        conf = float(d.get("conf", 0.0))
-        x1, y1, x2, y2 = d.get("bbox", [0, 0, 0, 0])
-        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
 
+def _draw_and_encode_jpeg_buf(
+    frame_bgr: np.ndarray,
+    bboxes: np.ndarray,
+    labels: list[str],
+    confs: list[float],
+    mutate: bool = False,
+) -> np.ndarray | None:
+    # mutate=True: caller không cần frame gốc nữa => vẽ thẳng lên nó, bỏ 1 lần copy cả ảnh
+    img = frame_bgr if mutate else frame_bgr.copy()
+
+    # ép int cả mảng 1 lần thay vì int() từng toạ độ
+    for (x1, y1, x2, y2), label, conf in zip(bboxes.astype(np.int32).tolist(), labels, confs):
         cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
         text = f"{label} {conf:.2f}"
         cv2.putText(img, text, (x1, max(15, y1 - 6)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
-    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 75])
-    if not ok:
+    ok, buf = cv2.imencode(".jpg", img, _JPEG_PARAMS)
+    # trả thẳng mảng của imencode (buffer protocol), chưa copy sang bytes
+    return buf if ok else None
+
+
+def _draw_and_encode_jpeg_bytes(
+    frame_bgr: np.ndarray,
+    bboxes: np.ndarray,
+    labels: list[str],
+    confs: list[float],
+    mutate: bool = False,
+) -> bytes | None:
+    buf = _draw_and_encode_jpeg_buf(frame_bgr, bboxes, labels, confs, mutate)
+    return None if buf is None else buf.tobytes()
+
+
+def _draw_and_encode_jpeg(
+    frame_bgr: np.ndarray,
+    bboxes: np.ndarray,
+    labels: list[str],
+    confs: list[float],
+    mutate: bool = False,
+) -> dict[str, Any] | None:
+    h, w = frame_bgr.shape[:2]
+    jpeg = _draw_and_encode_jpeg_buf(frame_bgr, bboxes, labels, confs, mutate)
+    if jpeg is None:
         return None
 
     return {
-        "jpegBase64": base64.b64encode(buf).decode("utf-8"),
+        # đọc thẳng buffer của mảng numpy => không tạo bản bytes trung gian
+        "jpegBase64": _b64encode_str(jpeg),
         "width": w,
         "height": h,
     }
 
 
-async def _fetch_image(url: str) -> np.ndarray | None:
+# hệ số thu nhỏ ảnh đưa vào detector (annotate / toạ độ trả về luôn theo ảnh gốc);
+# query string là str => ép int trước khi so Literal (JSON body thì đã là int)
+ReduceFactor = Annotated[
+    Literal[1, 2, 4, 8],
+    BeforeValidator(lambda v: int(v) if isinstance(v, str) else v),
+]
+
+
+# pool bytearray tái sử dụng giữa các lần tải ảnh => không cấp phát buffer mới mỗi request
+_FETCH_BUF_POOL: list[bytearray] = []
+_FETCH_BUF_POOL_MAX = 8
+_FETCH_BUF_INITIAL = 1 << 20  # 1MB, đủ cho đa số snapshot camera
+# buffer đã grow quá ngưỡng này (ảnh lớn hiếm gặp) thì bỏ, không giữ mãi trong pool
+_FETCH_BUF_POOL_KEEP_MAX = 8 << 20
+
+
+def _buf_write(buf: bytearray, n: int, chunk: bytes) -> int:
+    end = n + len(chunk)
+    if end > len(buf):
+        # nới gấp đôi để ít lần grow; buffer giữ nguyên dung lượng khi quay lại pool
+        buf.extend(bytes(max(end - len(buf), len(buf))))
+    buf[n:end] = chunk  # cùng độ dài => memcpy tại chỗ
+    return end
+
+
+async def _fetch_image(client: httpx.AsyncClient, url: str) -> np.ndarray | None:
+    buf = _FETCH_BUF_POOL.pop() if _FETCH_BUF_POOL else bytearray(_FETCH_BUF_INITIAL)
     try:
-        async with httpx.AsyncClient(timeout=15.0, follow_redirects=True) as client:
-            r = await client.get(url)
+        async with upstream_admission, client.stream("GET", url, timeout=15.0) as r:
             if r.status_code != 200:
                 return None
-            nparr = np.frombuffer(r.content, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            return img
+            # chặn ảnh quá lớn: báo trước qua Content-Length, hoặc vượt giới hạn lúc đang stream
+            max_bytes = settings.IMAGE_FETCH_MAX_BYTES
+            length = r.headers.get("content-length")
+            if length is not None and length.isdigit() and int(length) > max_bytes:
+                return None
+            n = 0
+            async for chunk in r.aiter_bytes():
+                if n + len(chunk) > max_bytes:
+                    return None
+                n = _buf_write(buf, n, chunk)
+
+        nparr = np.frombuffer(buf, np.uint8, count=n)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        del nparr  # nhả view trước khi trả buf về pool (bytearray bị export thì không grow được)
+        return img
     except Exception:
         return None
+    finally:
+        if len(buf) <= _FETCH_BUF_POOL_KEEP_MAX and len(_FETCH_BUF_POOL) < _FETCH_BUF_POOL_MAX:
+            _FETCH_BUF_POOL.append(buf)
+
+
+_COPY_BUFSIZE = 1 << 20  # 1MB/lần đọc-ghi => ít syscall hơn mặc định 64KB
+
+
+def _save_upload(src, up: str, ext: str) -> tuple[str, str]:
+    """
+    Chạy trong thread: ghi file upload + tính sha256 trong cùng 1 lượt đọc.
+    media_id = 32 ký tự đầu của sha256 => upload trùng nội dung dùng lại file cũ (kể cả khác ext).
+    """
+    h = hashlib.sha256()
+    tmp_path = os.path.join(up, f".{uuid.uuid4().hex}.part")
+    try:
+        with open(tmp_path, "wb") as f:
+            while chunk := src.read(_COPY_BUFSIZE):
+                h.update(chunk)
+                f.write(chunk)
+
+        media_id = h.hexdigest()[:32]
+        # nội dung đã có sẵn dưới {id}.* (ext bất kỳ) => dùng lại file đó, id chỉ trỏ 1 file
+        existing = resolve_media_path(media_id)
+        if existing is not None:
+            os.remove(tmp_path)
+            return media_id, existing
+        out_path = os.path.join(up, f"{media_id}{ext}")
+        os.replace(tmp_path, out_path)
+        return media_id, out_path
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+# path đúng dạng /api/media/{id} (chỉ match trên path, không dính query string)
+_MEDIA_RE = re.compile(rf"{re.escape(settings.API_PREFIX)}/media/([^/]+)/?")
+# url do chính server này phát ra (xem upload_image/upload_video)
+_OWN_NETLOC = urlsplit(_PUBLIC_BASE_URL).netloc.lower()
 
 
 def _resolve_media_url_to_local(video_or_image_url: str) -> str | None:
     """
     Nếu url là dạng http://host/api/media/{id} => resolve ra file local để cv2 đọc ổn.
+    Chỉ nhận url tương đối hoặc url trỏ về chính host của server.
     """
     try:
-        parsed = urlparse(video_or_image_url)
-        path = parsed.path or video_or_image_url
-        marker = f"{settings.API_PREFIX}/media/"
-        if marker in path:
-            media_id = path.split(marker, 1)[1].split("/", 1)[0]
-            return resolve_media_path(media_id)
-    except Exception:
-        pass
-    return None
+        parts = urlsplit(video_or_image_url)
+    except ValueError:
+        return None
+    if parts.netloc and parts.netloc.lower() != _OWN_NETLOC:
+        return None
+    m = _MEDIA_RE.fullmatch(parts.path)
+    return resolve_media_path(m.group(1)) if m else None
 
 
 # ================== 1) Upload image ==================
@@ -100,22 +226,19 @@ async def upload_image(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Only image is allowed")
 
     up = _upload_dir()
-    media_id = uuid.uuid4().hex
     ext = os.path.splitext(file.filename or "")[1].lower()
-    if not ext or not _is_image_ext(file.filename or ""):
+    if ext not in _IMG_EXTS:
         ext = ".jpg"
 
-    out_path = os.path.join(up, f"{media_id}{ext}")
-
     try:
         file.file.seek(0)
     except Exception:
         pass
 
-    with open(out_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    media_id, out_path = await asyncio.to_thread(_save_upload, file.file, up, ext)
+    remember_media_path(media_id, out_path)
 
-    url = f"{_public_base_url()}{settings.API_PREFIX}/media/{media_id}"
+    url = f"{_PUBLIC_BASE_URL}{settings.API_PREFIX}/media/{media_id}"
     return {"url": url}
 
 
@@ -126,43 +249,84 @@ async def upload_video(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Only video is allowed")
 
     up = _upload_dir()
-    media_id = uuid.uuid4().hex
     ext = os.path.splitext(file.filename or "")[1].lower() or ".mp4"
-    out_path = os.path.join(up, f"{media_id}{ext}")
 
     try:
         file.file.seek(0)
     except Exception:
         pass
 
-    with open(out_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    media_id, out_path = await asyncio.to_thread(_save_upload, file.file, up, ext)
+    remember_media_path(media_id, out_path)
 
-    url = f"{_public_base_url()}{settings.API_PREFIX}/media/{media_id}"
+    url = f"{_PUBLIC_BASE_URL}{settings.API_PREFIX}/media/{media_id}"
     return {"url": url, "id": "upload-video", "name": file.filename or "Upload Video"}
 
 
 # ================== 3) Detect image ==================
 class DetectImageReq(BaseModel):
     imageUrl: str
+    # 2/4/8: detector chạy trên ảnh thu nhỏ (snapshot 4K mà model chỉ chạy 640);
+    # bbox + ảnh annotated vẫn theo độ phân giải gốc. Giá trị khác => 422
+    reduce: ReduceFactor = 1
 
 
-@router.post("/detect-image")
-async def detect_image(req: DetectImageReq):
-    image_url = req.imageUrl.strip()
+def _bbox_array(detections: list) -> np.ndarray:
+    # (N, 4) float64 => giữ nguyên giá trị float trong JSON trả về
+    return np.array(
+        [[d.bbox.x1, d.bbox.y1, d.bbox.x2, d.bbox.y2] for d in detections],
+        dtype=np.float64,
+    ).reshape(-1, 4)
+
+
+def _scale_detections(result: DetectionResult, sx: float, sy: float) -> None:
+    # bbox từ ảnh thu nhỏ => toạ độ ảnh gốc (Detection do _finalize tạo mới, sửa tại chỗ được)
+    for d in result.detections:
+        b = d.bbox
+        b.x1, b.x2 = b.x1 * sx, b.x2 * sx
+        b.y1, b.y2 = b.y1 * sy, b.y2 * sy
 
+
+async def _decode_and_detect(
+    request: Request, image_url: str, reduce: int
+) -> tuple[np.ndarray | None, DetectionResult | None, bool]:
     # Nếu là /api/media/{id} => đọc local
     local = _resolve_media_url_to_local(image_url)
+    is_local = bool(local and os.path.exists(local))
 
-    if local and os.path.exists(local):
-        frame = cv2.imread(local)
+    # decode đúng 1 lần ở độ phân giải gốc: frame này dùng để vẽ annotated
+    if is_local:
+        frame = cv2.imread(local, cv2.IMREAD_COLOR)
         if frame is None:
             raise HTTPException(status_code=400, detail="Cannot read local image")
-
-        result = await DetectionService.detect_from_frame(frame=frame, camera_id=None, use_tracking=False)
     else:
-        # detect từ URL
-        result = await DetectionService.detect_from_url(image_url=image_url, camera_id=None, use_tracking=False)
+        frame = await _fetch_image(request.app.state.http, image_url)
+
+    if frame is None:
+        return None, None, is_local
+
+    h, w = frame.shape[:2]
+    small_w, small_h = max(1, w // reduce), max(1, h // reduce)
+    if reduce == 1 or (small_w, small_h) == (w, h):
+        return (
+            frame,
+            await DetectionService.detect_from_frame(frame=frame, camera_id=None, use_tracking=False),
+            is_local,
+        )
+
+    # chỉ detector thấy bản thu nhỏ; bbox nhân ngược về toạ độ gốc
+    small = cv2.resize(frame, (small_w, small_h), interpolation=cv2.INTER_AREA)
+    result = await DetectionService.detect_from_frame(frame=small, camera_id=None, use_tracking=False)
+    if result is not None:
+        _scale_detections(result, w / small_w, h / small_h)
+        result.frame_width, result.frame_height = w, h
+    return frame, result, is_local
+
+
+@router.post("/detect-image")
+async def detect_image(request: Request, req: DetectImageReq):
+    image_url = req.imageUrl.strip()
+    frame, result, _ = await _decode_and_detect(request, image_url, req.reduce)
 
     if result is None:
         return {
@@ -174,24 +338,19 @@ async def detect_image(req: DetectImageReq):
             "annotated": None,
         }
 
-    dets: list[dict[str, Any]] = []
-    summary: dict[str, int] = {}
+    detections = result.detections
+    bboxes = _bbox_array(detections)
+    labels = [d.class_name for d in detections]
+    confs = [float(d.confidence) for d in detections]
+    summary = dict(Counter(labels))
 
-    for det in result.detections:
-        label = det.class_name
-        conf = float(det.confidence)
-        bbox = [det.bbox.x1, det.bbox.y1, det.bbox.x2, det.bbox.y2]
-        dets.append({"label": label, "conf": conf, "bbox": bbox, "track_id": det.track_id})
-        summary[label] = summary.get(label, 0) + 1
+    dets: list[dict[str, Any]] = [
+        {"label": label, "conf": conf, "bbox": bbox, "track_id": d.track_id}
+        for label, conf, bbox, d in zip(labels, confs, bboxes.tolist(), detections)
+    ]
 
     # tạo annotated image base64 để FE render
-    frame = None
-    if local and os.path.exists(local):
-        frame = cv2.imread(local)
-    else:
-        frame = await _fetch_image(image_url)
-
-    annotated = _draw_and_encode_jpeg(frame, dets) if frame is not None else None
+    annotated = _draw_and_encode_jpeg(frame, bboxes, labels, confs, mutate=True)
 
     return {
         "mode": "sync",
@@ -201,3 +360,33 @@ async def detect_image(req: DetectImageReq):
         "summary": summary,
         "annotated": annotated,
     }
+
+
+@router.get("/detect-image/annotated.jpg")
+async def detect_image_annotated(request: Request, imageUrl: str, reduce: ReduceFactor = 1):
+    """
+    Giống /detect-image nhưng trả thẳng JPEG đã vẽ bbox => FE dùng làm <img src>, không tốn 33% base64
+    """
+    image_url = imageUrl.strip()
+    frame, result, is_local = await _decode_and_detect(request, image_url, reduce)
+    if frame is None or result is None:
+        raise HTTPException(status_code=404, detail="Cannot read image")
+
+    detections = result.detections
+    bboxes = _bbox_array(detections)
+    jpeg = _draw_and_encode_jpeg_bytes(
+        frame,
+        bboxes,
+        [d.class_name for d in detections],
+        [float(d.confidence) for d in detections],
+        mutate=True,
+    )
+    if jpeg is None:
+        raise HTTPException(status_code=500, detail="Cannot encode image")
+
+    return Response(
+        content=jpeg,
+        media_type="image/jpeg",
+        # file upload (/api/media/{uuid}) không đổi => cache được; ảnh camera thì luôn mới
+        headers={"Cache-Control": "public, max-age=86400" if is_local else "no-store"},
+    )
@@ -1,28 +1,41 @@
-import json
+import asyncio
 import os
+import re
 from typing import Any
 from app.core.config import settings
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import unquote_plus
+
+import orjson
 
 # khởi tạo bộ nhớ đệm 
-_cache: list[dict[str, Any]] | None = None
+_cache: tuple[dict[str, Any], ...] | None = None
+_cache_by_id: dict[str, dict[str, Any]] = {} # id -> camera, dựng cùng lúc với _cache
 _cache_mtime: float | None = None # lưu lại thời gian để biết khi nào phải thay đổi để cập nhập lại _cache
 
+# camId trong query của link camera Tp. HCM
+_HCM_RE = re.compile(r"[?&]camId=([^&#]+)")
+
+_WATCH_INTERVAL = 5.0 # giây giữa 2 lần kiểm tra mtime của file camera
 
-def _load_json() -> list[dict[str, Any]]:
-    global _cache, _cache_mtime
 
+def _data_path() -> str:
     path = settings.DATA
     if not os.path.isabs(path):
         path = os.path.join(os.getcwd(), path) # print(path) -> C:\Users\{Username}\Project\data\file.txt (vi du)
-    
+    return path
+
+
+def _load_json() -> tuple[dict[str, Any], ...]:
+    global _cache, _cache_by_id, _cache_mtime
+
+    path = _data_path()
     st = os.stat(path) # get in4 file 
     if _cache is not None and _cache_mtime == st.st_mtime:
         return _cache
     
     # đọc file
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
 
     if not isinstance(data, list):
         raise ValueError("data.json must be a JSON array (list of cameras)")
@@ -41,17 +54,11 @@ def _load_json() -> list[dict[str, Any]]:
         name = item.get("name", "")
         url_raw = item.get("url", "")
         url_clean = url_raw # Giá trị mặc định
-        if name == "Tp. HCM":
-            try:
-                parsed_url = urlparse(url_raw)
-                query_params = parse_qs(parsed_url.query)
-                
-                cam_id_list = query_params.get("camId")
-                if cam_id_list:
-                    cam_id = cam_id_list[0]
-                    url_clean = f"https://giaothong.hochiminhcity.gov.vn/render/ImageHandler.ashx?id={cam_id}"
-            except Exception:
-                url_clean = url_raw
+        if name == "Tp. HCM" and isinstance(url_raw, str):
+            m = _HCM_RE.search(url_raw)
+            if m:
+                cam_id = unquote_plus(m.group(1))
+                url_clean = f"https://giaothong.hochiminhcity.gov.vn/render/ImageHandler.ashx?id={cam_id}"
     
         normalized.append({
             "id": clean_id,
@@ -60,22 +67,42 @@ def _load_json() -> list[dict[str, Any]]:
             "url": url_clean,
         })
     
-    _cache = normalized
+    _cache = tuple(normalized)
+    _cache_by_id = {c["id"]: c for c in normalized}
     _cache_mtime = st.st_mtime
-    return normalized
+    return _cache
+
+
+def preload_cameras() -> None:
+    _load_json()
+
+
+async def watch_cameras(interval: float = _WATCH_INTERVAL) -> None:
+    """
+    Chạy nền (lifespan): stat file ngoài event loop, chỉ parse lại khi mtime đổi
+    """
+    path = _data_path()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            st = await asyncio.to_thread(os.stat, path)
+            if st.st_mtime != _cache_mtime:
+                await asyncio.to_thread(_load_json)
+        except (OSError, ValueError):
+            # file đang được ghi dở / bị xoá => giữ cache cũ, lần sau thử lại
+            continue
+
 
 class CameraService:
     @staticmethod
-    async def list_camera(skip: int = 50, limit: int = 0) -> tuple[list[dict],int]:
-        items = _load_json()
+    async def list_camera(skip: int = 50, limit: int = 0) -> tuple[tuple[dict, ...],int]:
+        # cache đã nạp sẵn lúc startup => chỉ cắt, không I/O
+        items = _cache if _cache is not None else _load_json()
         total = len(items) # số lượng camera
         return items[skip: skip + limit], total
     
     @staticmethod
     async def get_camera(camera_id: str) -> dict | None:
-        item = _load_json()
-        for cam in item:
-            if cam == camera_id:
-                return cam
-        
-        return None
+        if _cache is None:
+            _load_json()
+        return _cache_by_id.get(camera_id)
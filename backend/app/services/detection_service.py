@@ -1,9 +1,12 @@
 import asyncio
 import logging
 import os
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import Optional
+from urllib.parse import urlparse
 
 import cv2
 import httpx
@@ -14,17 +17,23 @@ from app.models.detection import (
     Detection,
     DetectionResult,
     ParkingViolation,
+    RedLightViolation,
     ZonePolygon,
 )
+from app.services.geometry import points_in_poly
 from app.services.tracker_service import TrackerManager
 from app.services.zone_service import ZoneService
-from shapely.geometry import Point, Polygon
 
 logger = logging.getLogger(__name__)
 
 _model = None
 _model_lock = asyncio.Lock()
-_executor = ThreadPoolExecutor(max_workers=2)
+# FP16 chỉ có ý nghĩa trên CUDA; set lúc load model
+_half = False
+# I/O (decode ảnh, chờ frame từ VideoCapture) tách khỏi inference:
+# RTSP treo không chặn YOLO; 1 worker inference => GPU/CUDA context luôn tuần tự
+_io_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="det-io")
+_infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="det-infer")
 
 VEHICLE_CLASSES = {
     0: "person",
@@ -36,10 +45,12 @@ VEHICLE_CLASSES = {
 }
 
 VEHICLE_CLASS_IDS = set(VEHICLE_CLASSES.keys())
+_VEHICLE_CLASS_ID_LIST = sorted(VEHICLE_CLASS_IDS)
+_VEHICLE_CLASS_ID_ARR = np.array(_VEHICLE_CLASS_ID_LIST, dtype=np.int64)
 
 
 async def _load_model():
-    global _model
+    global _model, _half
     async with _model_lock:
         if _model is not None:
             return _model
@@ -50,12 +61,18 @@ async def _load_model():
         if not os.path.isabs(model_path):
             model_path = os.path.join(os.getcwd(), model_path)
 
-        _model = YOLO(model_path)
+        # .engine (TensorRT, export FP16/INT8 sẵn) / .onnx... load thẳng, chỉ .pt mới fuse + .to() được
+        is_pytorch = model_path.endswith(".pt")
+        _model = YOLO(model_path, task="detect")
 
         import torch
 
-        if torch.cuda.is_available():
-            _model.to("cuda")
+        _half = torch.cuda.is_available()
+        if is_pytorch:
+            # gộp Conv+BN 1 lần lúc load => mỗi lần predict bớt 1 phép BN / layer
+            _model.fuse()
+            if _half:
+                _model.to("cuda")
 
         return _model
 
@@ -66,16 +83,120 @@ async def _fetch_image(url: str) -> Optional[np.ndarray]:
             response = await client.get(url)
             if response.status_code != 200:
                 return None
-            image_bytes = response.content
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            return image
+            nparr = np.frombuffer(response.content, np.uint8)
+        # decode JPEG vài MB tốn hàng chục ms => chạy trong executor, không chặn event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_io_pool, cv2.imdecode, nparr, cv2.IMREAD_COLOR)
     except Exception:
         return None
 
 
+# stream live: giữ 1 VideoCapture / URL, thread nền đọc liên tục, chỉ giữ frame mới nhất
+_LIVE_SCHEMES = frozenset({"rtsp", "rtsps", "rtmp", "udp", "tcp", "srt"})
+_CAP_FIRST_FRAME_TIMEOUT = 10.0
+# không ai hỏi frame trong N giây => đóng capture, nhả thread + kết nối
+_CAP_IDLE_SECONDS = 60.0
+# FFmpeg: mở / đọc quá lâu thì trả lỗi thay vì block mãi (stream treo mà không đóng kết nối)
+_CAP_OPEN_TIMEOUT_MS = 10000
+_CAP_READ_TIMEOUT_MS = 5000
+# frame cũ hơn N giây => coi như stream đã treo, không trả frame đó nữa
+_CAP_STALE_SECONDS = 5.0
+
+
+def _is_live_source(video_url: str) -> bool:
+    u = urlparse(video_url)
+    return u.scheme.lower() in _LIVE_SCHEMES or u.path.lower().endswith(".m3u8")
+
+
+def _open_video_capture(video_url: str) -> cv2.VideoCapture:
+    # timeout phải truyền lúc mở (set() sau khi mở không áp cho bước open)
+    cap = cv2.VideoCapture(
+        video_url,
+        cv2.CAP_FFMPEG,
+        [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, _CAP_OPEN_TIMEOUT_MS,
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, _CAP_READ_TIMEOUT_MS,
+        ],
+    )
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+class _LatestFrame:
+    """
+    Đọc frame liên tục trong thread riêng, chỉ giữ frame cuối (latest-frame-wins).
+    Bỏ được TCP handshake + chờ keyframe mỗi request.
+    """
+
+    def __init__(self, video_url: str):
+        self.video_url = video_url
+        # (frame, thời điểm đọc) gán 1 lần => get() không thấy frame mới với timestamp cũ
+        self._latest: Optional[tuple[np.ndarray, float]] = None
+        self._stopped = False
+        self.last_access = time.monotonic()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        cap = _open_video_capture(self.video_url)
+        try:
+            if not cap.isOpened():
+                return
+            while not self._stopped and time.monotonic() - self.last_access < _CAP_IDLE_SECONDS:
+                ret, frame = cap.read()
+                if not ret or frame is None:
+                    return
+                # cap.read() cấp mảng mới mỗi lần => gán thẳng, consumer không bị ghi đè
+                self._latest = (frame, time.monotonic())
+                self._ready.set()
+        except Exception:
+            logger.exception("Video reader stopped: %s", self.video_url)
+        finally:
+            cap.release()
+            self._ready.set()  # đánh thức get() đang chờ khi mở / đọc lỗi
+            with _caps_lock:
+                if _caps.get(self.video_url) is self:
+                    del _caps[self.video_url]
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def is_stale(self) -> bool:
+        # đã có frame nhưng lâu rồi không có frame mới => read() đang treo
+        latest = self._latest
+        return latest is not None and time.monotonic() - latest[1] > _CAP_STALE_SECONDS
+
+    def stop(self) -> None:
+        # thread tự thoát sau lần read() kế tiếp (tối đa _CAP_READ_TIMEOUT_MS)
+        self._stopped = True
+
+    def get(self) -> Optional[np.ndarray]:
+        self.last_access = time.monotonic()
+        self._ready.wait(_CAP_FIRST_FRAME_TIMEOUT)
+        latest = self._latest
+        if latest is None or time.monotonic() - latest[1] > _CAP_STALE_SECONDS:
+            return None
+        return latest[0]
+
+
+_caps: dict[str, _LatestFrame] = {}
+_caps_lock = threading.Lock()
+
+
 def _capture_video_frame(video_url: str) -> Optional[np.ndarray]:
     try:
+        if _is_live_source(video_url):
+            with _caps_lock:
+                reader = _caps.get(video_url)
+                if reader is None or not reader.is_alive() or reader.is_stale():
+                    # stream treo => bỏ reader cũ, mở kết nối mới
+                    if reader is not None:
+                        reader.stop()
+                    reader = _caps[video_url] = _LatestFrame(video_url)
+            return reader.get()
+
+        # file (upload / mp4 qua http): giữ hành vi cũ, luôn lấy frame đầu
         cap = cv2.VideoCapture(video_url)
         if not cap.isOpened():
             return None
@@ -91,37 +212,385 @@ def _capture_video_frame(video_url: str) -> Optional[np.ndarray]:
         return None
 
 
-def _run_inference(model, image: np.ndarray) -> list:
+def _run_inference(model, image: np.ndarray | list[np.ndarray]) -> list:
     results = model.predict(
         source=image,
         conf=0.25,
         iou=0.45,
-        classes=list(VEHICLE_CLASS_IDS),
+        classes=_VEHICLE_CLASS_ID_LIST,
         verbose=False,
-        half=True,
+        half=_half,
     )
     return results
 
 
-def _point_in_polygon(point: tuple[float, float], polygon_points: list) -> bool:
-    poly = Polygon([(p.x, p.y) for p in polygon_points])
-    return poly.contains(Point(point[0], point[1]))
+# Traffic light: ngưỡng S/V chung và các dải Hue (OpenCV H trong [0, 180])
+_TL_SV_LOWER = np.array([0, 50, 50], dtype=np.uint8)
+_TL_SV_UPPER = np.array([180, 255, 255], dtype=np.uint8)
+_TL_HUE_BINS = 181
+_TL_RED_HUE1 = (0, 12)
+_TL_RED_HUE2 = (155, 180)
+_TL_YELLOW_HUE = (12, 40)
+_TL_GREEN_HUE = (35, 95)
+_TL_KERNEL = np.ones((3, 3), np.uint8)
+_TL_DENOISE_MIN_AREA = 4096
+# ROI lớn hơn ngưỡng => thu nhỏ (INTER_AREA) còn ~ngần này pixel trước khi phân tích
+_TL_MAX_ANALYSIS_AREA = 4096
+
+
+def _tl_stats_dense(
+    roi: np.ndarray, mask: np.ndarray
+) -> tuple[int, int, np.ndarray | None]:
+    """
+    Trả về (max_brightness, total_bright_pixels, hue_hist) trên cả ROI 2D (có morphology).
+    hue_hist = None khi đã biết kết quả là 'unknown'.
+    """
+    # Focus on bright areas (traffic lights are bright when on)
+    # Kiểm tra tối ngay sau 1 lần cvtColor GRAY, trước mọi phép HSV: minMaxLoc có mask
+    # thay cho bitwise_and (gray, mask) rồi max => đèn tắt thì chỉ tốn đúng 1 pass
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+
+    # Find the brightest regions using adaptive threshold
+    max_brightness = int(cv2.minMaxLoc(gray, mask)[1])
+    if max_brightness < 50:
+        return max_brightness, 0, None
+
+    # Create brightness mask - focus on pixels that are at least 60% of max brightness
+    # (threshold trên gray chưa mask: pixel ngoài zone bị AND với mask ngay dưới)
+    brightness_threshold = max(50, int(max_brightness * 0.6))
+    _, bright_mask = cv2.threshold(gray, brightness_threshold, 255, cv2.THRESH_BINARY)
+
+    # Combine with zone mask, then apply morphological operations to clean up noise
+    analysis_mask = cv2.bitwise_and(bright_mask, mask)
+    analysis_mask = cv2.morphologyEx(analysis_mask, cv2.MORPH_OPEN, _TL_KERNEL)
+    analysis_mask = cv2.morphologyEx(analysis_mask, cv2.MORPH_CLOSE, _TL_KERNEL)
+
+    total_bright_pixels = cv2.countNonZero(analysis_mask)
+    if total_bright_pixels < 10:
+        return max_brightness, total_bright_pixels, None
+
+    # Mọi dải màu đều cần S, V trong [50, 255] => 1 lần inRange cho S/V,
+    # AND với analysis_mask, rồi 1 histogram Hue thay cho 4 inRange + 4 bitwise + 3 countNonZero
+    hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+    sv_mask = cv2.inRange(hsv, _TL_SV_LOWER, _TL_SV_UPPER)
+    color_mask = cv2.bitwise_and(sv_mask, analysis_mask)
+    hue_hist = cv2.calcHist([hsv], [0], color_mask, [_TL_HUE_BINS], [0, _TL_HUE_BINS])
+    return max_brightness, total_bright_pixels, hue_hist.ravel()
+
+
+def _tl_stats_sparse(
+    roi: np.ndarray, mask: np.ndarray, min_bright_pixels: int = 10
+) -> tuple[int, int, np.ndarray | None]:
+    """
+    Như _tl_stats_dense nhưng không morphology: gom K pixel trong polygon thành (1, K, 3)
+    rồi chỉ convert / threshold K pixel đó thay vì cả bounding box.
+    min_bright_pixels nhỏ hơn 10 khi ROI đã bị thu nhỏ.
+    """
+    ys_idx, xs_idx = np.nonzero(mask)
+    if ys_idx.size == 0:
+        return 0, 0, None
+    pix = roi[ys_idx, xs_idx].reshape(1, -1, 3)
+
+    gray = cv2.cvtColor(pix, cv2.COLOR_BGR2GRAY).ravel()
+    max_brightness = int(gray.max())
+    if max_brightness < 50:
+        return max_brightness, 0, None
+
+    brightness_threshold = max(50, int(max_brightness * 0.6))
+    bright = gray > brightness_threshold  # == THRESH_BINARY
+    total_bright_pixels = int(np.count_nonzero(bright))
+    if total_bright_pixels < min_bright_pixels:
+        return max_brightness, total_bright_pixels, None
+
+    hsv = cv2.cvtColor(pix, cv2.COLOR_BGR2HSV).reshape(-1, 3)
+    sel = bright & (hsv[:, 1] >= 50) & (hsv[:, 2] >= 50)
+    hue_hist = np.bincount(hsv[sel, 0], minlength=_TL_HUE_BINS)
+    return max_brightness, total_bright_pixels, hue_hist
+
+
+def _poly_xy(polygon_points: list) -> tuple[np.ndarray, np.ndarray]:
+    xs = np.array([p.x for p in polygon_points], dtype=np.float64)
+    ys = np.array([p.y for p in polygon_points], dtype=np.float64)
+    return xs, ys
+
+
+# zone.id -> (list points đã dùng để build, xs, ys, AABB (xmin, ymin, xmax, ymax))
+# ZoneService.get_zones trả model_copy() nông => list points giữ nguyên identity tới khi zone bị sửa,
+# nên so `is` là đủ để biết cache còn đúng (zone mới / update_zones => list mới => build lại)
+_poly_cache: dict[
+    str, tuple[list, np.ndarray, np.ndarray, tuple[float, float, float, float]]
+] = {}
+
+
+def _zone_entry(
+    zone: ZonePolygon,
+) -> tuple[list, np.ndarray, np.ndarray, tuple[float, float, float, float]]:
+    entry = _poly_cache.get(zone.id)
+    if entry is not None and entry[0] is zone.points:
+        return entry
+    xs, ys = _poly_xy(zone.points)
+    # zone rỗng => AABB rỗng (min > max), mọi điểm bị loại
+    aabb = (
+        (float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max()))
+        if xs.size
+        else (0.0, 0.0, -1.0, -1.0)
+    )
+    entry = (zone.points, xs, ys, aabb)
+    _poly_cache[zone.id] = entry
+    return entry
+
+
+def _bbox_centers(detections: list[Detection]) -> np.ndarray:
+    # (N, 2) tâm bbox, tính 1 lần cho mọi zone
+    return np.array(
+        [
+            ((d.bbox.x1 + d.bbox.x2) / 2, (d.bbox.y1 + d.bbox.y2) / 2)
+            for d in detections
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+
+
+def _zone_mask(zone: ZonePolygon, centers: np.ndarray) -> np.ndarray:
+    _, xs, ys, (x0, y0, x1, y1) = _zone_entry(zone)
+    cx, cy = centers[:, 0], centers[:, 1]
+    # loại nhanh tâm ngoài AABB của zone (phần lớn khi zone nhỏ); ray-casting vốn trả False cho chúng
+    idx = np.flatnonzero((cx >= x0) & (cx <= x1) & (cy >= y0) & (cy <= y1))
+    out = np.zeros(centers.shape[0], dtype=bool)
+    if idx.size:
+        # 1 lần gọi ray-casting (numba / numpy) cho các điểm còn lại; fancy index => mảng liền
+        out[idx] = points_in_poly(cx[idx], cy[idx], xs, ys)
+    return out
+
+
+def _points_in_zones(
+    centers: np.ndarray, zones: list[ZonePolygon], cols: Optional[list[int]] = None
+) -> np.ndarray:
+    # ma trận (N, Z): out[i, j] = tâm i nằm trong zone j; mỗi cột 1 lần gọi kernel cho cả N điểm
+    # cols: chỉ tính các cột này (cột khác để False) khi caller chỉ cần 1 loại zone
+    out = np.zeros((centers.shape[0], len(zones)), dtype=bool)
+    for j in range(len(zones)) if cols is None else cols:
+        out[:, j] = _zone_mask(zones[j], centers)
+    return out
+
+
+def _first_zone(inside: np.ndarray) -> np.ndarray:
+    # index zone đầu tiên chứa từng tâm (giống break khi duyệt zones), -1 = không thuộc zone nào
+    return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+
+def _finalize(
+    boxes,
+    camera_id: Optional[str],
+    use_tracking: bool,
+    frame_shape: tuple[int, ...],
+    start_time: float,
+) -> DetectionResult:
+    """
+    Hậu xử lý chung cho detect_from_url / detect_from_frame:
+    lọc class xe, dựng Detection, gắn track_id, đếm theo class.
+    """
+    # 1 lần copy device -> host cho cả batch thay vì 3 lần / box
+    xyxys = boxes.xyxy.cpu().numpy()
+    confs = boxes.conf.cpu().numpy()
+    clss = boxes.cls.cpu().numpy().astype(np.int64)
+    keep = np.isin(clss, _VEHICLE_CLASS_ID_ARR)
+    xyxys, confs, clss = xyxys[keep], confs[keep], clss[keep]
+
+    # dữ liệu nội bộ từ model (đã ép float/int) => bỏ qua validate
+    detections = [
+        Detection.model_construct(
+            bbox=BoundingBox.model_construct(x1=x1, y1=y1, x2=x2, y2=y2),
+            class_name=VEHICLE_CLASSES[cls_id],
+            class_id=cls_id,
+            confidence=conf,
+            track_id=None,
+        )
+        for (x1, y1, x2, y2), conf, cls_id in zip(
+            xyxys.tolist(), confs.tolist(), clss.tolist()
+        )
+    ]
 
+    if use_tracking and camera_id:
+        tracker = TrackerManager.get_tracker(camera_id)
+        tracker.update(list(zip(xyxys, clss.tolist())))
+
+        # tracker ghi lại track_id theo đúng thứ tự input => join theo index,
+        # không so tâm đã round (float32 vs float64 lệch khoá => hầu hết ra None)
+        for det, track_id in zip(detections, tracker.last_track_ids):
+            det.track_id = track_id
+
+    cls_ids, counts = np.unique(clss, return_counts=True)
+    vehicle_count = {
+        VEHICLE_CLASSES[c]: n for c, n in zip(cls_ids.tolist(), counts.tolist())
+    }
+
+    return DetectionResult.model_construct(
+        detections=detections,
+        vehicle_count=vehicle_count,
+        total_count=len(detections),
+        frame_width=frame_shape[1],
+        frame_height=frame_shape[0],
+        processing_time_ms=(time.time() - start_time) * 1000,
+    )
 
-def _get_bbox_center(bbox: BoundingBox) -> tuple[float, float]:
-    return ((bbox.x1 + bbox.x2) / 2, (bbox.y1 + bbox.y2) / 2)
+
+def _parking_cols(zones: list[ZonePolygon]) -> list[int]:
+    return [j for j, z in enumerate(zones) if z.is_parking_zone]
+
+
+def _parking_from(
+    detections: list[Detection],
+    zones: list[ZonePolygon],
+    inside: np.ndarray,
+    camera_id: str,
+) -> list[ParkingViolation]:
+    # inside: (N, Z) của đúng detections x zones (ít nhất các cột parking đã tính)
+    violations = []
+    cols = _parking_cols(zones)
+    if not cols:
+        return violations
+
+    rows = [i for i, d in enumerate(detections) if d.track_id is not None]
+    if not rows:
+        return violations
+
+    tracker = TrackerManager.get_tracker(camera_id)
+    threshold = settings.PARKING_VIOLATION_THRESHOLD
+    zone_idx = _first_zone(inside[np.ix_(rows, cols)])
+
+    # duyệt theo thứ tự detection => thứ tự violations như cũ
+    for i in np.flatnonzero(zone_idx >= 0):
+        det = detections[rows[i]]
+        zone = zones[cols[zone_idx[i]]]
+        duration = tracker.get_track_duration(det.track_id)
+
+        if duration >= threshold:
+            violations.append(
+                ParkingViolation.model_construct(
+                    track_id=det.track_id,
+                    vehicle_class=det.class_name,
+                    zone_id=zone.id,
+                    zone_name=zone.name,
+                    duration_seconds=duration,
+                    bbox=det.bbox,
+                )
+            )
+
+    return violations
+
+
+def _red_light_targets(
+    zones: list[ZonePolygon],
+) -> list[tuple[int, ZonePolygon, Optional[ZonePolygon]]]:
+    """
+    Các zone mà xe nằm trong là vượt đèn đỏ, theo thứ tự zones: (cột, zone, đèn liên kết).
+
+    Logic:
+    1. Find all stop_line zones that are linked to a traffic_light zone
+    2. Check if the linked traffic_light is currently red
+    3. If a vehicle crosses the stop_line while light is red = violation
+    Không có stop line nào => zone đèn đang đỏ (hành vi cũ), đèn liên kết = None.
+    """
+    # Build a map of traffic light zones by ID
+    traffic_light_map = {z.id: z for z in zones if z.is_traffic_light}
+
+    # Find stop line zones that have a linked traffic light
+    stop_lines = [
+        (j, z) for j, z in enumerate(zones) if z.is_stop_line and z.linked_traffic_light_id
+    ]
+
+    if not stop_lines:
+        # Fallback to old behavior: check if vehicle is in traffic light zone when red
+        # This maintains backward compatibility
+        return [
+            (j, z, None) for j, z in enumerate(zones) if z.is_traffic_light and z.is_red_light
+        ]
+
+    targets = []
+    for j, stop_line in stop_lines:
+        # Check if the linked traffic light exists and is red
+        linked_light = traffic_light_map.get(stop_line.linked_traffic_light_id)
+
+        if not linked_light:
+            logger.warning(
+                f"Stop line '{stop_line.name}' has invalid linked_traffic_light_id: "
+                f"{stop_line.linked_traffic_light_id}"
+            )
+            continue
+
+        # Only check violation if the traffic light is RED
+        if linked_light.is_red_light:
+            targets.append((j, stop_line, linked_light))
+    return targets
+
+
+def _red_light_rows(detections: list[Detection]) -> list[int]:
+    # xe có track (không tính người) mới xét vượt đèn
+    return [
+        i
+        for i, d in enumerate(detections)
+        if d.track_id is not None and d.class_name != "person"
+    ]
+
+
+def _red_light_from(
+    detections: list[Detection],
+    rows: list[int],
+    targets: list[tuple[int, ZonePolygon, Optional[ZonePolygon]]],
+    inside: np.ndarray,
+) -> list[RedLightViolation]:
+    violations = []
+    if not rows or not targets:
+        return violations
+
+    # zone đầu tiên (theo thứ tự zones) chứa tâm xe
+    zone_idx = _first_zone(inside[np.ix_(rows, [t[0] for t in targets])])
+    # cùng 1 frame => mọi vi phạm chung 1 timestamp
+    ts = datetime.now().isoformat()
+    for i in np.flatnonzero(zone_idx >= 0):
+        det = detections[rows[i]]
+        _, zone, linked_light = targets[zone_idx[i]]
+        if linked_light is None:
+            zone_name = zone.name
+        else:
+            zone_name = f"{zone.name} (Light: {linked_light.name})"
+            logger.info(
+                f"Red light violation detected: Vehicle #{det.track_id} "
+                f"({det.class_name}) crossed stop line '{zone.name}' "
+                f"while light '{linked_light.name}' is RED"
+            )
+        violations.append(
+            RedLightViolation.model_construct(
+                track_id=det.track_id,
+                vehicle_class=det.class_name,
+                zone_id=zone.id,
+                zone_name=zone_name,
+                bbox=det.bbox,
+                timestamp=ts,
+            )
+        )
+
+    return violations
 
 
 class DetectionService:
     @staticmethod
-    def detect_traffic_light_color(frame: np.ndarray, zone_points: list) -> str:
+    def detect_traffic_light_color(
+        frame: np.ndarray, zone_points: list | np.ndarray
+    ) -> str:
         """
         Detect traffic light color by analyzing the pixels within the zone.
         Uses brightness-focused detection to find the active light.
+        zone_points: list Point, hoặc mảng (K, 2) int32 caller đã cache sẵn.
         Returns: 'red', 'yellow', 'green', or 'unknown'
         """
         try:
-            pts = np.array([[int(p.x), int(p.y)] for p in zone_points], np.int32)
+            # mảng int32 dựng sẵn (vd. cache vẽ zone của video stream) => không duyệt Point mỗi frame
+            if isinstance(zone_points, np.ndarray):
+                pts = zone_points
+            else:
+                pts = np.array([[int(p.x), int(p.y)] for p in zone_points], np.int32)
 
             x, y, w, h = cv2.boundingRect(pts)
             logger.debug(
@@ -137,79 +606,63 @@ class DetectionService:
                 logger.warning(f"Invalid zone coordinates: x2={x2}, y2={y2}")
                 return "unknown"
 
-            roi = frame[y:y2, x:x2].copy()
+            # view, không copy: chỉ đọc roi
+            roi = frame[y:y2, x:x2]
 
             mask = np.zeros((y2 - y, x2 - x), dtype=np.uint8)
-            local_pts = pts - [x, y]
+            local_pts = pts - np.array((x, y), np.int32)  # giữ int32 => fillPoly không phải convert
             cv2.fillPoly(mask, [local_pts], 255)
 
-            # Convert to HSV for color analysis
-            hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-
-            # Focus on bright areas (traffic lights are bright when on)
-            # Extract the Value channel and find bright regions
-            gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-            gray_masked = cv2.bitwise_and(gray, gray, mask=mask)
+            # ROI nhỏ (đèn thường < 64x64): open/close hầu như không đổi màu trội => bỏ,
+            # và khi không cần morphology thì chỉ xử lý đúng các pixel trong polygon
+            area = (y2 - y) * (x2 - x)
+            denoise = settings.TL_DENOISE or area >= _TL_DENOISE_MIN_AREA
+            tl_stats = _tl_stats_dense if denoise else _tl_stats_sparse
+
+            # màu trội là tỉ lệ trên histogram => phân tích trên ROI thu nhỏ scale lần mỗi chiều
+            scale = 1
+            if settings.TL_DOWNSAMPLE and area > _TL_MAX_ANALYSIS_AREA:
+                scale = max(1, int(np.sqrt(area / _TL_MAX_ANALYSIS_AREA)))
+
+            if scale == 1:
+                max_brightness, total_bright_pixels, hue_hist = tl_stats(roi, mask)
+            else:
+                f = 1.0 / scale
+                roi = cv2.resize(roi, None, fx=f, fy=f, interpolation=cv2.INTER_AREA)
+                mask = cv2.resize(mask, None, fx=f, fy=f, interpolation=cv2.INTER_NEAREST)
+                k = scale * scale
+                # INTER_AREA (trung bình khối scale x scale) đã khử nhiễu lẻ; open 3x3 trên ảnh nhỏ
+                # lại xoá mất đèn chỉ còn 1-2 px => bỏ morphology; ngưỡng 10 px tính theo ảnh gốc
+                max_brightness, total_bright_pixels, hue_hist = _tl_stats_sparse(
+                    roi, mask, -(-10 // k)
+                )
+                if hue_hist is not None:
+                    # quy đổi số pixel về độ phân giải gốc => các ngưỡng tuyệt đối bên dưới giữ nghĩa
+                    total_bright_pixels *= k
+                    hue_hist = hue_hist * k
 
-            # Find the brightest regions using adaptive threshold
-            max_brightness = np.max(gray_masked)
             logger.debug(f"Max brightness in zone: {max_brightness}")
             if max_brightness < 50:  # Too dark, no active light
                 logger.debug("Zone too dark, no active light detected")
                 return "unknown"
 
-            # Create brightness mask - focus on pixels that are at least 60% of max brightness
-            brightness_threshold = max(50, int(max_brightness * 0.6))
-            _, bright_mask = cv2.threshold(
-                gray_masked, brightness_threshold, 255, cv2.THRESH_BINARY
-            )
-
-            # Combine with zone mask
-            analysis_mask = cv2.bitwise_and(bright_mask, mask)
-
-            # Apply morphological operations to clean up noise
-            kernel = np.ones((3, 3), np.uint8)
-            analysis_mask = cv2.morphologyEx(analysis_mask, cv2.MORPH_OPEN, kernel)
-            analysis_mask = cv2.morphologyEx(analysis_mask, cv2.MORPH_CLOSE, kernel)
-
-            total_bright_pixels = cv2.countNonZero(analysis_mask)
             logger.debug(f"Total bright pixels: {total_bright_pixels}")
             if total_bright_pixels < 10:  # Too few bright pixels
                 logger.debug("Too few bright pixels for detection")
                 return "unknown"
 
-            # Expanded HSV ranges for better detection under various lighting conditions
-            # Red color (wraps around in HSV)
-            red_lower1 = np.array([0, 50, 50])  # Lower saturation/value for dim lights
-            red_upper1 = np.array([12, 255, 255])  # Expanded hue range
-            red_lower2 = np.array([155, 50, 50])  # Wrap-around red
-            red_upper2 = np.array([180, 255, 255])
-
-            # Yellow/Amber color
-            yellow_lower = np.array([12, 50, 50])
-            yellow_upper = np.array([40, 255, 255])  # Expanded to include orange-yellow
-
-            # Green color
-            green_lower = np.array([35, 50, 50])  # Start earlier for cyan-green
-            green_upper = np.array(
-                [95, 255, 255]
-            )  # Extended for blue-green traffic lights
+            hue_cum = np.concatenate(([0.0], np.cumsum(hue_hist)))
 
-            # Create color masks combined with brightness mask
-            red_mask1 = cv2.inRange(hsv, red_lower1, red_upper1)
-            red_mask2 = cv2.inRange(hsv, red_lower2, red_upper2)
-            red_mask = cv2.bitwise_or(red_mask1, red_mask2)
-            red_mask = cv2.bitwise_and(red_mask, analysis_mask)
+            def _hue_count(lo: int, hi: int) -> int:
+                # số pixel có Hue trong [lo, hi]
+                return int(hue_cum[hi + 1] - hue_cum[lo])
 
-            yellow_mask = cv2.inRange(hsv, yellow_lower, yellow_upper)
-            yellow_mask = cv2.bitwise_and(yellow_mask, analysis_mask)
-
-            green_mask = cv2.inRange(hsv, green_lower, green_upper)
-            green_mask = cv2.bitwise_and(green_mask, analysis_mask)
-
-            red_count = cv2.countNonZero(red_mask)
-            yellow_count = cv2.countNonZero(yellow_mask)
-            green_count = cv2.countNonZero(green_mask)
+            # Red color (wraps around in HSV): [0, 12] ∪ [155, 180]
+            red_count = _hue_count(*_TL_RED_HUE1) + _hue_count(*_TL_RED_HUE2)
+            # Yellow/Amber color (expanded to include orange-yellow)
+            yellow_count = _hue_count(*_TL_YELLOW_HUE)
+            # Green color (start earlier for cyan-green, extended for blue-green traffic lights)
+            green_count = _hue_count(*_TL_GREEN_HUE)
 
             logger.debug(
                 f"Color counts - Red: {red_count}, Yellow: {yellow_count}, Green: {green_count}"
@@ -283,11 +736,11 @@ class DetectionService:
 
         start_time = time.time()
 
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(_executor, _run_inference, model, image)
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(_infer_pool, _run_inference, model, image)
 
         if not results or len(results) == 0:
-            return DetectionResult(
+            return DetectionResult.model_construct(
                 detections=[],
                 vehicle_count={},
                 total_count=0,
@@ -296,78 +749,14 @@ class DetectionService:
                 processing_time_ms=(time.time() - start_time) * 1000,
             )
 
-        result = results[0]
-        boxes = result.boxes
-
-        detections = []
-        tracking_inputs = []
-
-        for i in range(len(boxes)):
-            box = boxes[i]
-            xyxy = box.xyxy[0].cpu().numpy()
-            conf = float(box.conf[0].cpu().numpy())
-            cls_id = int(box.cls[0].cpu().numpy())
-
-            if cls_id not in VEHICLE_CLASSES:
-                continue
-
-            bbox = BoundingBox(
-                x1=float(xyxy[0]),
-                y1=float(xyxy[1]),
-                x2=float(xyxy[2]),
-                y2=float(xyxy[3]),
-            )
-
-            tracking_inputs.append((xyxy, cls_id))
-
-            detections.append(
-                Detection(
-                    bbox=bbox,
-                    class_name=VEHICLE_CLASSES[cls_id],
-                    class_id=cls_id,
-                    confidence=conf,
-                    track_id=None,
-                )
-            )
-
-        if use_tracking and camera_id:
-            tracker = TrackerManager.get_tracker(camera_id)
-            tracked = tracker.update(tracking_inputs)
-
-            track_map = {}
-            for track_id, bbox_arr, cls_id in tracked:
-                cx, cy = (
-                    (bbox_arr[0] + bbox_arr[2]) / 2,
-                    (bbox_arr[1] + bbox_arr[3]) / 2,
-                )
-                track_map[(round(cx, 1), round(cy, 1))] = track_id
-
-            for det in detections:
-                cx = round((det.bbox.x1 + det.bbox.x2) / 2, 1)
-                cy = round((det.bbox.y1 + det.bbox.y2) / 2, 1)
-                det.track_id = track_map.get((cx, cy))
-
-        vehicle_count = {}
-        for det in detections:
-            vehicle_count[det.class_name] = vehicle_count.get(det.class_name, 0) + 1
-
-        processing_time = (time.time() - start_time) * 1000
-
-        return DetectionResult(
-            detections=detections,
-            vehicle_count=vehicle_count,
-            total_count=len(detections),
-            frame_width=image.shape[1],
-            frame_height=image.shape[0],
-            processing_time_ms=processing_time,
-        )
+        return _finalize(results[0].boxes, camera_id, use_tracking, image.shape, start_time)
 
     @staticmethod
     async def detect_from_video_url(
         video_url: str, camera_id: Optional[str] = None, use_tracking: bool = True
     ) -> Optional[DetectionResult]:
-        loop = asyncio.get_event_loop()
-        frame = await loop.run_in_executor(_executor, _capture_video_frame, video_url)
+        loop = asyncio.get_running_loop()
+        frame = await loop.run_in_executor(_io_pool, _capture_video_frame, video_url)
 
         if frame is None:
             return None
@@ -382,11 +771,11 @@ class DetectionService:
 
         start_time = time.time()
 
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(_executor, _run_inference, model, frame)
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(_infer_pool, _run_inference, model, frame)
 
         if not results or len(results) == 0:
-            return DetectionResult(
+            return DetectionResult.model_construct(
                 detections=[],
                 vehicle_count={},
                 total_count=0,
@@ -395,227 +784,88 @@ class DetectionService:
                 processing_time_ms=(time.time() - start_time) * 1000,
             )
 
-        result = results[0]
-        boxes = result.boxes
-
-        detections = []
-        tracking_inputs = []
-
-        for i in range(len(boxes)):
-            box = boxes[i]
-            xyxy = box.xyxy[0].cpu().numpy()
-            conf = float(box.conf[0].cpu().numpy())
-            cls_id = int(box.cls[0].cpu().numpy())
+        return _finalize(results[0].boxes, camera_id, use_tracking, frame.shape, start_time)
 
-            if cls_id not in VEHICLE_CLASSES:
-                continue
-
-            bbox = BoundingBox(
-                x1=float(xyxy[0]),
-                y1=float(xyxy[1]),
-                x2=float(xyxy[2]),
-                y2=float(xyxy[3]),
-            )
-
-            tracking_inputs.append((xyxy, cls_id))
+    @staticmethod
+    async def detect_batch(
+        frames: list[np.ndarray], camera_id: Optional[str] = None, use_tracking: bool = False
+    ) -> list[DetectionResult]:
+        """
+        Như detect_from_frame cho nhiều frame, nhưng chỉ 1 lần predict (batch trên GPU).
+        Kết quả đúng thứ tự frames; có tracking thì frame sau được coi là tiếp theo frame trước.
+        """
+        if not frames:
+            return []
+        model = await _load_model()
 
-            detections.append(
-                Detection(
-                    bbox=bbox,
-                    class_name=VEHICLE_CLASSES[cls_id],
-                    class_id=cls_id,
-                    confidence=conf,
-                    track_id=None,
-                )
-            )
+        start_time = time.time()
 
-        if use_tracking and camera_id:
-            tracker = TrackerManager.get_tracker(camera_id)
-            tracked = tracker.update(tracking_inputs)
+        loop = asyncio.get_running_loop()
+        # list ảnh => ultralytics letterbox + stack thành 1 batch
+        results = await loop.run_in_executor(_infer_pool, _run_inference, model, frames)
 
-            track_map = {}
-            for track_id, bbox_arr, cls_id in tracked:
-                cx, cy = (
-                    (bbox_arr[0] + bbox_arr[2]) / 2,
-                    (bbox_arr[1] + bbox_arr[3]) / 2,
-                )
-                track_map[(round(cx, 1), round(cy, 1))] = track_id
-
-            for det in detections:
-                cx = round((det.bbox.x1 + det.bbox.x2) / 2, 1)
-                cy = round((det.bbox.y1 + det.bbox.y2) / 2, 1)
-                det.track_id = track_map.get((cx, cy))
-
-        vehicle_count = {}
-        for det in detections:
-            vehicle_count[det.class_name] = vehicle_count.get(det.class_name, 0) + 1
-
-        processing_time = (time.time() - start_time) * 1000
-
-        return DetectionResult(
-            detections=detections,
-            vehicle_count=vehicle_count,
-            total_count=len(detections),
-            frame_width=frame.shape[1],
-            frame_height=frame.shape[0],
-            processing_time_ms=processing_time,
-        )
+        return [
+            _finalize(r.boxes, camera_id, use_tracking, f.shape, start_time)
+            for r, f in zip(results, frames)
+        ]
 
     @staticmethod
     async def check_parking_violations(
         detections: list[Detection], zones: list[ZonePolygon], camera_id: str
     ) -> list[ParkingViolation]:
-        violations = []
-        parking_zones = [z for z in zones if z.is_parking_zone]
-
-        if not parking_zones:
-            return violations
-
-        tracker = TrackerManager.get_tracker(camera_id)
-        threshold = settings.PARKING_VIOLATION_THRESHOLD
-
-        for det in detections:
-            if det.track_id is None:
-                continue
-
-            center = _get_bbox_center(det.bbox)
-
-            for zone in parking_zones:
-                if _point_in_polygon(center, zone.points):
-                    duration = tracker.get_track_duration(det.track_id)
-
-                    if duration >= threshold:
-                        violations.append(
-                            ParkingViolation(
-                                track_id=det.track_id,
-                                vehicle_class=det.class_name,
-                                zone_id=zone.id,
-                                zone_name=zone.name,
-                                duration_seconds=duration,
-                                bbox=det.bbox,
-                            )
-                        )
-                    break
-
-        return violations
+        cols = _parking_cols(zones)
+        if not cols or not detections:
+            return []
+        inside = _points_in_zones(_bbox_centers(detections), zones, cols)
+        return _parking_from(detections, zones, inside, camera_id)
 
     @staticmethod
     async def get_zones_occupancy(
         detections: list[Detection], zones: list[ZonePolygon]
     ) -> dict[str, int]:
-        occupancy = {}
-
-        for zone in zones:
-            count = 0
-            for det in detections:
-                center = _get_bbox_center(det.bbox)
-                if _point_in_polygon(center, zone.points):
-                    count += 1
-            occupancy[zone.id] = count
+        if not detections:
+            return {zone.id: 0 for zone in zones}
 
-        return occupancy
+        counts = _points_in_zones(_bbox_centers(detections), zones).sum(axis=0)
+        return {zone.id: int(c) for zone, c in zip(zones, counts.tolist())}
 
     @staticmethod
     async def check_red_light_violations(
         detections: list[Detection], zones: list[ZonePolygon], camera_id: str
-    ) -> list:
+    ) -> list[RedLightViolation]:
         """
-        Check for red light violations using stop line zones.
-
-        Logic:
-        1. Find all stop_line zones that are linked to a traffic_light zone
-        2. Check if the linked traffic_light is currently red
-        3. If a vehicle crosses the stop_line while light is red = violation
+        Check for red light violations using stop line zones (xem _red_light_targets).
         """
-        from datetime import datetime
-
-        from app.models.detection import RedLightViolation
-
-        violations = []
+        rows = _red_light_rows(detections)
+        if not rows:
+            return []
+        targets = _red_light_targets(zones)
+        if not targets:
+            return []
+        inside = _points_in_zones(_bbox_centers(detections), zones, [t[0] for t in targets])
+        return _red_light_from(detections, rows, targets, inside)
 
-        # Build a map of traffic light zones by ID
-        traffic_light_map = {z.id: z for z in zones if z.is_traffic_light}
+    @staticmethod
+    async def check_violations(
+        detections: list[Detection], zones: list[ZonePolygon], camera_id: str
+    ) -> tuple[list[ParkingViolation], list[RedLightViolation], dict[str, int]]:
+        """
+        Parking + vượt đèn đỏ + occupancy trong 1 lượt: tâm bbox và ma trận
+        (detection x zone) chỉ tính 1 lần cho mọi loại zone.
+        """
+        if not detections:
+            return [], [], {zone.id: 0 for zone in zones}
 
-        # Find stop line zones that have a linked traffic light
-        stop_line_zones = [
-            z for z in zones if z.is_stop_line and z.linked_traffic_light_id
-        ]
+        inside = _points_in_zones(_bbox_centers(detections), zones)
+        parking = _parking_from(detections, zones, inside, camera_id)
 
-        if not stop_line_zones:
-            # Fallback to old behavior: check if vehicle is in traffic light zone when red
-            # This maintains backward compatibility
-            traffic_light_zones = [
-                z for z in zones if z.is_traffic_light and z.is_red_light
-            ]
-
-            if not traffic_light_zones:
-                return violations
-
-            for det in detections:
-                if det.track_id is None:
-                    continue
-                if det.class_name == "person":
-                    continue
-
-                center = _get_bbox_center(det.bbox)
-
-                for zone in traffic_light_zones:
-                    if _point_in_polygon(center, zone.points):
-                        violations.append(
-                            RedLightViolation(
-                                track_id=det.track_id,
-                                vehicle_class=det.class_name,
-                                zone_id=zone.id,
-                                zone_name=zone.name,
-                                bbox=det.bbox,
-                                timestamp=datetime.now().isoformat(),
-                            )
-                        )
-                        break
-            return violations
-
-        # New behavior: check stop line zones
-        for det in detections:
-            if det.track_id is None:
-                continue
-
-            if det.class_name == "person":
-                continue
-
-            center = _get_bbox_center(det.bbox)
-
-            for stop_line in stop_line_zones:
-                # Check if the linked traffic light exists and is red
-                linked_light = traffic_light_map.get(stop_line.linked_traffic_light_id)
-
-                if not linked_light:
-                    logger.warning(
-                        f"Stop line '{stop_line.name}' has invalid linked_traffic_light_id: "
-                        f"{stop_line.linked_traffic_light_id}"
-                    )
-                    continue
-
-                # Only check violation if the traffic light is RED
-                if not linked_light.is_red_light:
-                    continue
-
-                # Check if vehicle is in the stop line zone
-                if _point_in_polygon(center, stop_line.points):
-                    violations.append(
-                        RedLightViolation(
-                            track_id=det.track_id,
-                            vehicle_class=det.class_name,
-                            zone_id=stop_line.id,
-                            zone_name=f"{stop_line.name} (Light: {linked_light.name})",
-                            bbox=det.bbox,
-                            timestamp=datetime.now().isoformat(),
-                        )
-                    )
-                    logger.info(
-                        f"Red light violation detected: Vehicle #{det.track_id} "
-                        f"({det.class_name}) crossed stop line '{stop_line.name}' "
-                        f"while light '{linked_light.name}' is RED"
-                    )
-                    break
+        rows = _red_light_rows(detections)
+        red_light = (
+            _red_light_from(detections, rows, _red_light_targets(zones), inside)
+            if rows
+            else []
+        )
 
-        return violations
+        counts = inside.sum(axis=0)
+        occupancy = {zone.id: int(c) for zone, c in zip(zones, counts.tolist())}
+        return parking, red_light, occupancy
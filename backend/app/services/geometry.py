@@ -0,0 +1,53 @@
+import numpy as np
+
+try:
+    # numba không bắt buộc: có thì JIT vòng ray-casting, không thì dùng bản numpy
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _point_in_poly(px, py, xs, ys):
+    # crossing-number (ray casting) trên mảng đỉnh đã flatten
+    inside = False
+    n = xs.shape[0]
+    j = n - 1
+    for i in range(n):
+        yi = ys[i]
+        yj = ys[j]
+        if (yi > py) != (yj > py):
+            if px < (xs[j] - xs[i]) * (py - yi) / (yj - yi) + xs[i]:
+                inside = not inside
+        j = i
+    return inside
+
+
+def _points_in_poly_loop(pxs, pys, xs, ys):
+    out = np.empty(pxs.shape[0], dtype=np.bool_)
+    for k in range(pxs.shape[0]):
+        out[k] = point_in_poly(pxs[k], pys[k], xs, ys)
+    return out
+
+
+def _points_in_poly_np(pxs, pys, xs, ys):
+    # cùng thuật toán, vector hoá theo điểm: mỗi cạnh là vài phép numpy trên cả N điểm
+    inside = np.zeros(pxs.shape[0], dtype=bool)
+    n = xs.shape[0]
+    j = n - 1
+    for i in range(n):
+        yi = ys[i]
+        yj = ys[j]
+        if yi != yj:  # cạnh nằm ngang không bao giờ cắt tia
+            crosses = (yi > pys) != (yj > pys)
+            x_cross = (xs[j] - xs[i]) * (pys - yi) / (yj - yi) + xs[i]
+            inside ^= crosses & (pxs < x_cross)
+        j = i
+    return inside
+
+
+if njit is not None:
+    point_in_poly = njit(cache=True)(_point_in_poly)
+    points_in_poly = njit(cache=True)(_points_in_poly_loop)
+else:
+    point_in_poly = _point_in_poly
+    points_in_poly = _points_in_poly_np
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import functools
 import os
 import re
 import shutil
+import threading
+import time
 import uuid
+from collections import Counter, OrderedDict
+from functools import lru_cache
 from typing import Any
 
 import cv2
@@ -12,13 +18,25 @@ import numpy as np
 import httpx
 from fastapi import UploadFile
 
+from app.core.admission import upstream_admission
 from app.core.config import settings
+from app.routes.media_routes import remember_media_path
 from app.services.detection_service import DetectionService
 
+try:
+    # pybase64 không bắt buộc: có thì encode base64 bằng SIMD (AVX2/NEON), không thì stdlib
+    from pybase64 import b64encode_as_string as _b64encode_str
+except ImportError:
+    def _b64encode_str(data) -> str:
+        return base64.b64encode(data).decode("ascii")
+
 
 _VIDEO_EXTS = (".mp4", ".mov", ".mkv", ".avi", ".webm", ".m3u8")
 _IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
 
+# link đầu tiên trong text (compile 1 lần thay vì tra cache của re mỗi request)
+_URL_RE = re.compile(r"(https?://\S+)")
+
 
 def _is_video_name(name: str) -> bool:
     n = (name or "").lower()
@@ -33,14 +51,14 @@ def _is_image_name(name: str) -> bool:
 def _extract_first_url(text: str | None) -> str | None:
     if not text:
         return None
-    m = re.search(r"(https?://\S+)", text.strip())
+    # \S+ không chứa khoảng trắng => không cần strip text / group
+    m = _URL_RE.search(text)
     if not m:
         return None
-    url = m.group(1).strip()
-    url = url.rstrip(').,;"\'')
-    return url
+    return m.group(1).rstrip(').,;"\'')
 
 
+@lru_cache(maxsize=1)  # makedirs chỉ cần chạy lần đầu
 def _upload_dir() -> str:
     path = os.path.normpath(settings.UPLOAD_DIR)
     if not os.path.isabs(path):
@@ -49,36 +67,136 @@ def _upload_dir() -> str:
     return path
 
 
-def _public_base_url() -> str:
-    # Có thể set env PUBLIC_BASE_URL nếu chạy server ở host khác
-    return os.getenv("PUBLIC_BASE_URL", "http://localhost:8000").rstrip("/")
+# Có thể set env PUBLIC_BASE_URL nếu chạy server ở host khác
+_PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000").rstrip("/")
+
+
+@functools.cache
+def _turbojpeg():
+    # PyTurboJPEG (libjpeg-turbo, SIMD) nếu cài, không thì None => dùng cv2
+    try:
+        from turbojpeg import TJSAMP_420, TurboJPEG
+
+        tj = TurboJPEG()
+        tj.buffer_size  # bản cũ không có encode(dst=) => coi như không có
+        return tj, TJSAMP_420
+    except Exception:
+        return None
+
+
+def _tiff_orientation(tiff: bytes) -> int:
+    # IFD0 của khối TIFF trong EXIF: tìm tag 0x0112 (Orientation), kiểu SHORT
+    if len(tiff) < 8:
+        return 1
+    order = {b"II": "little", b"MM": "big"}.get(tiff[:2])
+    if order is None:
+        return 1
+    off = int.from_bytes(tiff[4:8], order)
+    if off + 2 > len(tiff):
+        return 1
+    for k in range(int.from_bytes(tiff[off:off + 2], order)):
+        e = off + 2 + 12 * k
+        if e + 12 > len(tiff):
+            break
+        if int.from_bytes(tiff[e:e + 2], order) == 0x0112:
+            return int.from_bytes(tiff[e + 8:e + 10], order)
+    return 1
+
+
+def _jpeg_orientation(data: bytes) -> int:
+    """
+    EXIF Orientation của JPEG (1 = không xoay / không có tag).
+    Chỉ duyệt các marker header trước SOS, không decode ảnh.
+    """
+    if data[:2] != b"\xff\xd8":
+        return 1
+    i, n = 2, len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return 1
+        marker = data[i + 1]
+        if marker == 0xFF:  # byte đệm giữa các marker
+            i += 1
+            continue
+        if marker in (0xD9, 0xDA):  # EOI / SOS => hết phần metadata
+            return 1
+        seg_len = int.from_bytes(data[i + 2:i + 4], "big")
+        if marker == 0xE1 and data[i + 4:i + 10] == b"Exif\x00\x00":
+            return _tiff_orientation(data[i + 10:i + 2 + seg_len])
+        i += 2 + seg_len
+    return 1
+
+
+def _decode_image(data: bytes) -> np.ndarray | None:
+    # chạy trong thread (decode ảnh lớn vài chục ms, không chặn event loop)
+    tj = _turbojpeg()
+    # TurboJPEG bỏ qua EXIF Orientation, cv2.imdecode thì xoay theo nó
+    # => ảnh cần xoay (ảnh chụp điện thoại) đi đường cv2 để giữ đúng chiều như trước
+    if tj is not None and _jpeg_orientation(data) == 1:
+        try:
+            # libjpeg-turbo decode thẳng ra BGR; không phải JPEG (png, webp...) => raise, dùng cv2
+            return tj[0].decode(data)
+        except Exception:
+            pass
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
 
 
-async def _fetch_image(url: str) -> np.ndarray | None:
+async def _fetch_image(client: httpx.AsyncClient, url: str) -> np.ndarray | None:
+    # client dùng chung của app (app.state.http) => giữ keep-alive, không handshake lại mỗi lần
     try:
-        async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-            r = await client.get(url)
-            if r.status_code != 200:
-                return None
-            nparr = np.frombuffer(r.content, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            return img
+        async with upstream_admission:
+            r = await client.get(url, timeout=10.0)
+        if r.status_code != 200:
+            return None
+        return await asyncio.to_thread(_decode_image, r.content)
     except Exception:
         return None
 
 
-def _draw_and_encode_jpeg(frame_bgr: np.ndarray, dets: list[dict[str, Any]]) -> tuple[str, int, int]:
-    CLASS_COLORS = {
-        "car": (0, 255, 0),
-        "motorcycle": (0, 255, 255),
-        "bus": (0, 136, 255),
-        "truck": (255, 0, 255),
-        "bicycle": (255, 255, 0),
-        "person": (255, 136, 0),
-    }
+# buffer output JPEG tái sử dụng theo thread, chỉ grow khi ảnh lớn hơn
+_tls = threading.local()
+
+
+def _encode_jpeg(img: np.ndarray, quality: int = 75) -> bytes | memoryview | None:
+    tj = _turbojpeg()
+    if tj is not None:
+        tj, subsample = tj
+        need = tj.buffer_size(img, subsample)
+        buf = getattr(_tls, "jpeg_buf", None)
+        if buf is None or len(buf) < need:
+            buf = _tls.jpeg_buf = bytearray(need)
+        # 4:2:0 như mặc định của cv2 => kích thước / chất lượng tương đương
+        _, n = tj.encode(img, quality=quality, jpeg_subsample=subsample, dst=buf)
+        return memoryview(buf)[:n]
+
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf if ok else None
+
+
+_CLASS_COLORS = {
+    "car": (0, 255, 0),
+    "motorcycle": (0, 255, 255),
+    "bus": (0, 136, 255),
+    "truck": (255, 0, 255),
+    "bicycle": (255, 255, 0),
+    "person": (255, 136, 0),
+}
+_DEFAULT_COLOR = (0, 255, 0)
+
+
+@lru_cache(maxsize=1024)
+def _text_size(text: str) -> tuple[int, int]:
+    # text = "label 0.xx" => vài class x 101 mức conf, lặp lại rất nhiều giữa các ảnh
+    return cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
 
-    img = frame_bgr.copy()
-    h, w = img.shape[:2]
+
+def _draw_and_encode_jpeg(
+    frame_bgr: np.ndarray, dets: list[dict[str, Any]], mutate: bool = False
+) -> tuple[str, int, int]:
+    h, w = frame_bgr.shape[:2]
+    # mutate=True: caller không cần frame gốc nữa => vẽ thẳng lên nó;
+    # không có gì để vẽ => encode thẳng frame. Cả 2 đều bỏ 1 lần copy cả ảnh
+    img = frame_bgr.copy() if dets and not mutate else frame_bgr
 
     for d in dets:
         label = str(d.get("label", "obj"))
@@ -86,11 +204,11 @@ def _draw_and_encode_jpeg(frame_bgr: np.ndarray, dets: list[dict[str, Any]]) ->
         x1, y1, x2, y2 = d.get("bbox", [0, 0, 0, 0])
         x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
 
-        color = CLASS_COLORS.get(label, (0, 255, 0))
+        color = _CLASS_COLORS.get(label, _DEFAULT_COLOR)
         cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
 
         text = f"{label} {conf:.2f}"
-        (tw, th), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+        tw, th = _text_size(text)
         y_text = max(0, y1 - th - 6)
         cv2.rectangle(img, (x1, y_text), (x1 + tw + 6, y_text + th + 6), color, -1)
         cv2.putText(
@@ -104,19 +222,97 @@ def _draw_and_encode_jpeg(frame_bgr: np.ndarray, dets: list[dict[str, Any]]) ->
             cv2.LINE_AA,
         )
 
-    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 75])
-    if not ok:
+    buf = _encode_jpeg(img, 75)
+    if buf is None:
         return ("", w, h)
-    b64 = base64.b64encode(buf).decode("utf-8")
+    # buf là memoryview / mảng numpy: encode đọc thẳng buffer, không qua .tobytes()
+    b64 = _b64encode_str(buf)
     return (b64, w, h)
 
 
+def _dets_and_summary(detections: list) -> tuple[list[dict[str, Any]], dict[str, int]]:
+    # 1 comprehension + Counter thay cho vòng append / summary.get(label, 0) + 1 từng detection
+    labels = [d.class_name for d in detections]
+    dets = [
+        {
+            "label": label,
+            "conf": float(d.confidence),
+            "bbox": [d.bbox.x1, d.bbox.y1, d.bbox.x2, d.bbox.y2],
+            "track_id": d.track_id,
+        }
+        for label, d in zip(labels, detections)
+    ]
+    return dets, dict(Counter(labels))
+
+
+_COPY_BUFSIZE = 1 << 20  # 1MB/lần đọc-ghi => ít syscall hơn mặc định 64KB
+
+
+def _copy_to_path(src, out_path: str) -> None:
+    with open(out_path, "wb") as f:
+        shutil.copyfileobj(src, f, _COPY_BUFSIZE)
+
+
+# gom ảnh search vào batch: request đến trong lúc model đang chạy batch trước sẽ xếp hàng,
+# batch sau lấy hết (tối đa _DETECT_BATCH_MAX) => 1 lần predict. Không chờ thêm theo thời gian
+# nên request lẻ vẫn chạy ngay như gọi detect_from_frame
+_DETECT_BATCH_MAX = 8
+_detect_queue: asyncio.Queue | None = None
+_detect_task: asyncio.Task | None = None
+
+
+async def _detect_worker(queue: asyncio.Queue) -> None:
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < _DETECT_BATCH_MAX and not queue.empty():
+            batch.append(queue.get_nowait())
+        # request đã huỷ (client ngắt) thì bỏ khỏi batch
+        batch = [(frame, fut) for frame, fut in batch if not fut.done()]
+        if not batch:
+            continue
+        try:
+            results = await DetectionService.detect_batch(
+                [frame for frame, _ in batch], camera_id=None, use_tracking=False
+            )
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+
+async def _detect(frame: np.ndarray):
+    global _detect_queue, _detect_task
+    if _detect_task is None or _detect_task.done():
+        _detect_queue = asyncio.Queue()
+        _detect_task = asyncio.create_task(_detect_worker(_detect_queue))
+    fut = asyncio.get_running_loop().create_future()
+    _detect_queue.put_nowait((frame, fut))
+    return await fut
+
+
+# cache kết quả theo image_url: search lặp lại cùng link => bỏ qua tải + detect + encode
+_URL_CACHE_MAX = 128
+_URL_CACHE_TTL = 60.0  # giây; ảnh snapshot camera đổi theo thời gian => không giữ lâu
+
+
 class SearchService:
     def __init__(self) -> None:
         # giữ lại cho tương thích nếu FE có polling
         self.jobs: dict[str, dict[str, Any]] = {}
-
-    async def handle(self, text: str | None, url: str | None, files: list[UploadFile] | None):
+        # url -> (thời điểm lưu, response), LRU: cũ nhất nằm đầu
+        self._url_cache: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+    async def handle(
+        self,
+        text: str | None,
+        url: str | None,
+        files: list[UploadFile] | None,
+        http: httpx.AsyncClient,
+    ):
         files = files or []
 
         # Nếu link nằm trong text
@@ -151,7 +347,7 @@ class SearchService:
             is_image = _is_image_name(u)
 
             if is_image:
-                return await self._handle_image_url(url)
+                return await self._handle_image_url(http, url)
             if is_video:
                 return self._accept_video_url(url)
 
@@ -173,10 +369,19 @@ class SearchService:
             "error": None,
         }
 
-    async def _handle_image_url(self, image_url: str):
-        result = await DetectionService.detect_from_url(
-            image_url=image_url, camera_id=None, use_tracking=False
-        )
+    async def _handle_image_url(self, http: httpx.AsyncClient, image_url: str):
+        now = time.monotonic()
+        hit = self._url_cache.get(image_url)
+        if hit is not None:
+            if now - hit[0] < _URL_CACHE_TTL:
+                self._url_cache.move_to_end(image_url)
+                return hit[1]
+            del self._url_cache[image_url]
+
+        # tải + decode đúng 1 lần: cùng frame cho detect lẫn vẽ annotated
+        # (trước đây detect_from_url tải 1 lần rồi _fetch_image tải lại lần nữa)
+        frame = await _fetch_image(http, image_url)
+        result = await _detect(frame) if frame is not None else None
         if result is None:
             return {
                 "mode": "sync",
@@ -186,23 +391,13 @@ class SearchService:
                 "summary": {},
             }
 
-        dets = []
-        summary: dict[str, int] = {}
-        for det in result.detections:
-            label = det.class_name
-            conf = float(det.confidence)
-            bbox = [det.bbox.x1, det.bbox.y1, det.bbox.x2, det.bbox.y2]
-            dets.append({"label": label, "conf": conf, "bbox": bbox, "track_id": det.track_id})
-            summary[label] = summary.get(label, 0) + 1
-
-        frame = await _fetch_image(image_url)
-        annotated = None
-        if frame is not None:
-            b64, w, h = _draw_and_encode_jpeg(frame, dets)
-            if b64:
-                annotated = {"jpegBase64": b64, "width": w, "height": h}
+        dets, summary = _dets_and_summary(result.detections)
 
-        return {
+        # frame chỉ dùng để vẽ, không giữ lại (cache chỉ lưu response) => vẽ thẳng lên frame
+        b64, w, h = _draw_and_encode_jpeg(frame, dets, mutate=True)
+        annotated = {"jpegBase64": b64, "width": w, "height": h} if b64 else None
+
+        resp = {
             "mode": "sync",
             "status": "success" if dets else "empty",
             "source": {"kind": "image", "url": image_url},
@@ -210,11 +405,15 @@ class SearchService:
             "summary": summary,
             "annotated": annotated,
         }
+        # chỉ cache khi tải + detect được (lỗi mạng tạm thời thì lần sau thử lại)
+        self._url_cache[image_url] = (now, resp)
+        if len(self._url_cache) > _URL_CACHE_MAX:
+            self._url_cache.popitem(last=False)
+        return resp
 
     async def _handle_image_file(self, file: UploadFile):
         data = await file.read()
-        nparr = np.frombuffer(data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        frame = await asyncio.to_thread(_decode_image, data)
 
         if frame is None:
             return {
@@ -225,9 +424,7 @@ class SearchService:
                 "summary": {},
             }
 
-        result = await DetectionService.detect_from_frame(
-            frame=frame, camera_id=None, use_tracking=False
-        )
+        result = await _detect(frame)
         if result is None:
             return {
                 "mode": "sync",
@@ -237,16 +434,9 @@ class SearchService:
                 "summary": {},
             }
 
-        dets = []
-        summary: dict[str, int] = {}
-        for det in result.detections:
-            label = det.class_name
-            conf = float(det.confidence)
-            bbox = [det.bbox.x1, det.bbox.y1, det.bbox.x2, det.bbox.y2]
-            dets.append({"label": label, "conf": conf, "bbox": bbox, "track_id": det.track_id})
-            summary[label] = summary.get(label, 0) + 1
+        dets, summary = _dets_and_summary(result.detections)
 
-        b64, w, h = _draw_and_encode_jpeg(frame, dets)
+        b64, w, h = _draw_and_encode_jpeg(frame, dets, mutate=True)
         annotated = {"jpegBase64": b64, "width": w, "height": h} if b64 else None
 
         return {
@@ -288,10 +478,11 @@ class SearchService:
         except Exception:
             pass
 
-        with open(out_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        # copy file lớn (vài trăm MB) trong thread => không chặn event loop
+        await asyncio.to_thread(_copy_to_path, file.file, out_path)
+        remember_media_path(media_id, out_path)
 
-        public_url = f"{_public_base_url()}{settings.API_PREFIX}/media/{media_id}"
+        public_url = f"{_PUBLIC_BASE_URL}{settings.API_PREFIX}/media/{media_id}"
 
         return {
             "mode": "async",
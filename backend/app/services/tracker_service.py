@@ -1,8 +1,128 @@
+import threading
 import time
 from typing import Optional
 from collections import defaultdict
 import numpy as np
 
+try:
+    # scipy đi kèm ultralytics; thiếu thì quay về ghép greedy theo IoU
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+try:
+    # numba không bắt buộc: có thì JIT IoU + greedy thành 1 vòng lặp, không thì dùng bản numpy
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _iou_matrix_np(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # IoU từng cặp (N, 4) x (M, 4) -> (N, M) bằng broadcasting, không vòng lặp Python
+    xx1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    yy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    xx2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    yy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+
+    inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union != 0, inter / union, 0.0)
+
+
+def _iou_matrix_loop(a, b):
+    # cùng công thức, 1 lượt qua từng cặp => không tạo ~10 mảng (N, M) tạm như bản numpy
+    n = a.shape[0]
+    m = b.shape[0]
+    out = np.zeros((n, m), dtype=a.dtype)
+    for i in range(n):
+        ax1 = a[i, 0]
+        ay1 = a[i, 1]
+        ax2 = a[i, 2]
+        ay2 = a[i, 3]
+        area_a = (ax2 - ax1) * (ay2 - ay1)
+        for j in range(m):
+            w = min(ax2, b[j, 2]) - max(ax1, b[j, 0])
+            h = min(ay2, b[j, 3]) - max(ay1, b[j, 1])
+            if w <= 0 or h <= 0:
+                continue  # không giao nhau => IoU 0
+            inter = w * h
+            union = area_a + (b[j, 2] - b[j, 0]) * (b[j, 3] - b[j, 1]) - inter
+            if union != 0:
+                out[i, j] = inter / union
+    return out
+
+
+def _greedy_match_np(iou_matrix: np.ndarray, iou_threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    # chỉ sort các cặp đạt ngưỡng (thường rất ít so với N*M), không argsort cả ma trận
+    cand_rows, cand_cols = np.nonzero(iou_matrix >= iou_threshold)
+    # stable rồi đảo => IoU giảm dần, bằng nhau thì index phẳng lớn trước như trước đây
+    order = np.argsort(iou_matrix[cand_rows, cand_cols], kind="stable")[::-1]
+
+    used_rows = set()
+    used_cols = set()
+    rows, cols = [], []
+    for row, col in zip(cand_rows[order].tolist(), cand_cols[order].tolist()):
+        if row in used_rows or col in used_cols:
+            continue
+        rows.append(row)
+        cols.append(col)
+        used_rows.add(row)
+        used_cols.add(col)
+    return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+
+
+def _greedy_match_loop(iou_matrix, iou_threshold):
+    # greedy IoU giảm dần như bản numpy, used_rows / used_cols là mảng bool thay cho set
+    n, m = iou_matrix.shape
+    flat = iou_matrix.ravel()
+    cand = np.flatnonzero(flat >= iou_threshold)
+    order = np.argsort(flat[cand], kind="mergesort")[::-1]
+    used_rows = np.zeros(n, dtype=np.bool_)
+    used_cols = np.zeros(m, dtype=np.bool_)
+    rows = np.empty(min(n, m), dtype=np.intp)
+    cols = np.empty(min(n, m), dtype=np.intp)
+    k = 0
+    for o in order:
+        idx = cand[o]
+        row = idx // m
+        col = idx % m
+        if used_rows[row] or used_cols[col]:
+            continue
+        rows[k] = row
+        cols[k] = col
+        used_rows[row] = True
+        used_cols[col] = True
+        k += 1
+    return rows[:k], cols[:k]
+
+
+if njit is not None:
+    _iou_matrix = njit(cache=True)(_iou_matrix_loop)
+    _greedy_match = njit(cache=True)(_greedy_match_loop)
+else:
+    _iou_matrix = _iou_matrix_np
+    _greedy_match = _greedy_match_np
+
+
+def _match(iou_matrix: np.ndarray, iou_threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Ghép track (row) với detection (col), trả về 2 mảng rows, cols cùng độ dài.
+    Có scipy: Hungarian (tổng IoU lớn nhất) rồi bỏ cặp dưới ngưỡng; không thì greedy IoU giảm dần.
+    """
+    if linear_sum_assignment is not None:
+        # cặp dưới ngưỡng coi như IoU 0 => Hungarian không "đổi" 1 cặp hợp lệ lấy cặp sẽ bị bỏ
+        gain = np.where(iou_matrix >= iou_threshold, iou_matrix, 0.0)
+        rows, cols = linear_sum_assignment(gain, maximize=True)
+        keep = iou_matrix[rows, cols] >= iou_threshold
+        return rows[keep], cols[keep]
+
+    return _greedy_match(iou_matrix, iou_threshold)
+
+
 class SimpleTracker:
     def __init__(self, max_disappeared: int = 30, iou_threshold: float = 0.3):
         self.next_id = 0
@@ -12,30 +132,20 @@ class SimpleTracker:
         self.first_seen: dict[int, float] = {}
         self.max_disappeared = max_disappeared
         self.iou_threshold = iou_threshold
-
-    def _compute_iou(self, box1: np.ndarray, box2: np.ndarray) -> float:
-        x1 = max(box1[0], box2[0])
-        y1 = max(box1[1], box2[1])
-        x2 = min(box1[2], box2[2])
-        y2 = min(box1[3], box2[3])
-        
-        inter_area = max(0, x2 - x1) * max(0, y2 - y1)
-        box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
-        box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
-        union_area = box1_area + box2_area - inter_area
-        
-        if union_area == 0:
-            return 0.0
-        return inter_area / union_area
-
-    def _register(self, bbox: np.ndarray, class_id: int) -> int:
-        obj_id = self.next_id
-        self.objects[obj_id] = bbox
-        self.disappeared[obj_id] = 0
-        self.class_ids[obj_id] = class_id
-        self.first_seen[obj_id] = time.time()
-        self.next_id += 1
-        return obj_id
+        # track_id gán cho từng detection của lần update() gần nhất, đúng thứ tự input
+        self.last_track_ids: list[int] = []
+
+    def _register_bulk(self, bboxes: np.ndarray, class_ids: list[int]) -> list[int]:
+        # k track mới trong 1 lượt: 1 lần time.time(), id tăng dần theo thứ tự input
+        k = len(class_ids)
+        ids = list(range(self.next_id, self.next_id + k))
+        now = time.time()
+        self.objects.update(zip(ids, bboxes))
+        self.disappeared.update(dict.fromkeys(ids, 0))
+        self.class_ids.update(zip(ids, class_ids))
+        self.first_seen.update(dict.fromkeys(ids, now))
+        self.next_id += k
+        return ids
 
     def _deregister(self, obj_id: int):
         del self.objects[obj_id]
@@ -43,63 +153,57 @@ class SimpleTracker:
         del self.class_ids[obj_id]
         del self.first_seen[obj_id]
 
+    def _age(self, obj_id: int):
+        # tăng số frame mất dấu, quá max_disappeared thì bỏ track
+        self.disappeared[obj_id] += 1
+        if self.disappeared[obj_id] > self.max_disappeared:
+            self._deregister(obj_id)
+
+    def _tracked(self) -> list[tuple[int, np.ndarray, int]]:
+        return [(obj_id, bbox, self.class_ids[obj_id]) for obj_id, bbox in self.objects.items()]
+
     def update(self, detections: list[tuple[np.ndarray, int]]) -> list[tuple[int, np.ndarray, int]]:
         if len(detections) == 0:
+            self.last_track_ids = []
             for obj_id in list(self.disappeared.keys()):
-                self.disappeared[obj_id] += 1
-                if self.disappeared[obj_id] > self.max_disappeared:
-                    self._deregister(obj_id)
-            return [(obj_id, bbox, self.class_ids[obj_id]) for obj_id, bbox in self.objects.items()]
+                self._age(obj_id)
+            return self._tracked()
 
-        input_bboxes = np.array([d[0] for d in detections])
+        input_bboxes = np.array([d[0] for d in detections], dtype=np.float32).reshape(-1, 4)
         input_class_ids = [d[1] for d in detections]
 
         if len(self.objects) == 0:
-            for i in range(len(detections)):
-                self._register(input_bboxes[i], input_class_ids[i])
+            assigned = self._register_bulk(input_bboxes, input_class_ids)
         else:
+            assigned: list[int] = [-1] * len(detections)
             object_ids = list(self.objects.keys())
-            object_bboxes = np.array(list(self.objects.values()))
-
-            iou_matrix = np.zeros((len(object_ids), len(input_bboxes)))
-            for i, obj_bbox in enumerate(object_bboxes):
-                for j, inp_bbox in enumerate(input_bboxes):
-                    iou_matrix[i, j] = self._compute_iou(obj_bbox, inp_bbox)
-
-            used_rows = set()
-            used_cols = set()
-            matches = []
-
-            flat_indices = np.argsort(iou_matrix.flatten())[::-1]
-            for idx in flat_indices:
-                row = idx // iou_matrix.shape[1]
-                col = idx % iou_matrix.shape[1]
-                if row in used_rows or col in used_cols:
-                    continue
-                if iou_matrix[row, col] < self.iou_threshold:
-                    break
-                matches.append((row, col))
-                used_rows.add(row)
-                used_cols.add(col)
-
-            for row, col in matches:
+            object_bboxes = np.array(list(self.objects.values()), dtype=np.float32)
+
+            iou_matrix = _iou_matrix(object_bboxes, input_bboxes)
+
+            rows, cols = _match(iou_matrix, self.iou_threshold)
+            for row, col in zip(rows.tolist(), cols.tolist()):
                 obj_id = object_ids[row]
                 self.objects[obj_id] = input_bboxes[col]
                 self.class_ids[obj_id] = input_class_ids[col]
                 self.disappeared[obj_id] = 0
+                assigned[col] = obj_id
 
-            unused_rows = set(range(len(object_ids))) - used_rows
+            unused_rows = set(range(len(object_ids))).difference(rows.tolist())
             for row in unused_rows:
-                obj_id = object_ids[row]
-                self.disappeared[obj_id] += 1
-                if self.disappeared[obj_id] > self.max_disappeared:
-                    self._deregister(obj_id)
+                self._age(object_ids[row])
 
-            unused_cols = set(range(len(input_bboxes))) - used_cols
-            for col in unused_cols:
-                self._register(input_bboxes[col], input_class_ids[col])
+            used_cols = set(cols.tolist())
+            new_cols = [col for col in range(len(detections)) if col not in used_cols]
+            if new_cols:
+                new_ids = self._register_bulk(
+                    input_bboxes[new_cols], [input_class_ids[col] for col in new_cols]
+                )
+                for col, obj_id in zip(new_cols, new_ids):
+                    assigned[col] = obj_id
 
-        return [(obj_id, bbox, self.class_ids[obj_id]) for obj_id, bbox in self.objects.items()]
+        self.last_track_ids = assigned
+        return self._tracked()
 
     def get_track_duration(self, track_id: int) -> float:
         if track_id in self.first_seen:
@@ -111,24 +215,32 @@ class SimpleTracker:
         self.disappeared.clear()
         self.class_ids.clear()
         self.first_seen.clear()
+        self.last_track_ids = []
         self.next_id = 0
 
 
 class TrackerManager:
     _trackers: dict[str, SimpleTracker] = {}
+    # chỉ khoá lúc tạo tracker mới => 2 luồng cùng camera không tạo 2 SimpleTracker
+    _lock = threading.Lock()
 
     @classmethod
     def get_tracker(cls, camera_id: str) -> SimpleTracker:
-        if camera_id not in cls._trackers:
-            cls._trackers[camera_id] = SimpleTracker()
-        return cls._trackers[camera_id]
+        tracker = cls._trackers.get(camera_id)
+        if tracker is None:
+            with cls._lock:
+                tracker = cls._trackers.get(camera_id)
+                if tracker is None:
+                    tracker = cls._trackers[camera_id] = SimpleTracker()
+        return tracker
 
     @classmethod
     def reset_tracker(cls, camera_id: str):
-        if camera_id in cls._trackers:
-            cls._trackers[camera_id].reset()
+        tracker = cls._trackers.get(camera_id)
+        if tracker is not None:
+            tracker.reset()
 
     @classmethod
     def remove_tracker(cls, camera_id: str):
-        if camera_id in cls._trackers:
-            del cls._trackers[camera_id]
+        with cls._lock:
+            cls._trackers.pop(camera_id, None)
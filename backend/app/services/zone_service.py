@@ -1,58 +1,140 @@
-import json
+import asyncio
+import contextlib
 import os
+import uuid
+from functools import lru_cache
 from typing import Optional
+
+import orjson
+
 from app.core.config import settings
 from app.models.detection import ZonePolygon, ZoneConfig
 
-def _get_zone_file_path(camera_id: str) -> str:
+# bộ nhớ đệm zones theo camera: camera_id -> (mtime_ns của file, zones)
+_zones_cache: dict[str, tuple[int, list[ZonePolygon]]] = {}
+# 1 lock / file zones: load -> sửa -> ghi có await ở giữa, 2 request add cùng lúc
+# không được cùng đọc list cũ rồi ghi đè mất zone của nhau
+_zone_locks: dict[str, asyncio.Lock] = {}
+
+def _zone_lock(path: str) -> asyncio.Lock:
+    lock = _zone_locks.get(path)
+    if lock is None:
+        lock = _zone_locks[path] = asyncio.Lock()
+    return lock
+
+@lru_cache(maxsize=1)  # makedirs chỉ cần chạy lần đầu
+def _zones_dir() -> str:
     base_dir = settings.ZONES_DIR
     if not os.path.isabs(base_dir):
         base_dir = os.path.join(os.getcwd(), base_dir)
     os.makedirs(base_dir, exist_ok=True)
+    return base_dir
+
+def _get_zone_file_path(camera_id: str) -> str:
     safe_id = "".join(c if c.isalnum() else "_" for c in camera_id)
-    return os.path.join(base_dir, f"{safe_id}.json")
+    return os.path.join(_zones_dir(), f"{safe_id}.json")
+
+def _read_zones_file(path: str) -> list[ZonePolygon]:
+    # chạy trong thread: đọc + parse + validate
+    # orjson parse thẳng từ bytes => bỏ bước decode text của json stdlib
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
+    return [ZonePolygon(**z) for z in data]
+
+def _write_zones_file(path: str, zones: list[ZonePolygon]) -> int:
+    # chạy trong thread; trả mtime_ns mới để cập nhật cache
+    payload = orjson.dumps([z.model_dump() for z in zones], option=orjson.OPT_INDENT_2)
+    # ghi ra file tạm rồi os.replace (atomic) => crash giữa chừng không làm hỏng file zones cũ,
+    # reader đồng thời luôn thấy bản cũ hoặc bản mới đầy đủ
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    return os.stat(path).st_mtime_ns
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def _load_zones(camera_id: str, path: str) -> list[ZonePolygon]:
+    # list trong cache (không copy) => chỉ dùng nội bộ, không đưa ra ngoài service
+    try:
+        # stat chỉ đọc metadata (nằm sẵn trong cache của kernel) => gọi thẳng, rẻ hơn 1 lần nhảy thread
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        _zones_cache.pop(camera_id, None)
+        return []
+
+    cached = _zones_cache.get(camera_id)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        # cache miss => đọc file trong thread, không chặn event loop
+        zones = await asyncio.to_thread(_read_zones_file, path)
+    except Exception:
+        return []
+    _zones_cache[camera_id] = (mtime, zones)
+    return zones
+
+async def _save_zones(camera_id: str, path: str, zones: list[ZonePolygon]) -> bool:
+    # caller giữ _zone_lock(path)
+    zones = list(zones)
+    try:
+        mtime = await asyncio.to_thread(_write_zones_file, path, zones)
+        # ghi xong => cập nhật cache luôn theo mtime mới, lần get sau không phải đọc lại file
+        _zones_cache[camera_id] = (mtime, zones)
+        return True
+    except Exception:
+        _zones_cache.pop(camera_id, None)
+        return False
 
 class ZoneService:
     @staticmethod
     async def get_zones(camera_id: str) -> list[ZonePolygon]:
-        path = _get_zone_file_path(camera_id)
-        if not os.path.exists(path):
-            return []
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return [ZonePolygon(**z) for z in data]
-        except Exception:
-            return []
+        zones = await _load_zones(camera_id, _get_zone_file_path(camera_id))
+        # copy nông: caller (vd. video stream) có thể sửa is_red_light
+        return [z.model_copy() for z in zones]
 
     @staticmethod
     async def save_zones(camera_id: str, zones: list[ZonePolygon]) -> bool:
         path = _get_zone_file_path(camera_id)
-        try:
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump([z.model_dump() for z in zones], f, indent=2)
-            return True
-        except Exception:
-            return False
+        async with _zone_lock(path):
+            return await _save_zones(camera_id, path, zones)
 
     @staticmethod
     async def add_zone(camera_id: str, zone: ZonePolygon) -> list[ZonePolygon]:
-        zones = await ZoneService.get_zones(camera_id)
-        zones = [z for z in zones if z.id != zone.id]
-        zones.append(zone)
-        await ZoneService.save_zones(camera_id, zones)
-        return zones
+        path = _get_zone_file_path(camera_id)
+        async with _zone_lock(path):
+            # sửa trên list đã cache rồi ghi 1 lần (không copy toàn bộ zones qua get_zones)
+            zones = await _load_zones(camera_id, path)
+            zones = [z for z in zones if z.id != zone.id]
+            zones.append(zone)
+            await _save_zones(camera_id, path, zones)
+            return zones
 
     @staticmethod
     async def delete_zone(camera_id: str, zone_id: str) -> list[ZonePolygon]:
-        zones = await ZoneService.get_zones(camera_id)
-        zones = [z for z in zones if z.id != zone_id]
-        await ZoneService.save_zones(camera_id, zones)
-        return zones
+        path = _get_zone_file_path(camera_id)
+        async with _zone_lock(path):
+            zones = await _load_zones(camera_id, path)
+            zones = [z for z in zones if z.id != zone_id]
+            await _save_zones(camera_id, path, zones)
+            return zones
 
     @staticmethod
     async def clear_zones(camera_id: str) -> bool:
         path = _get_zone_file_path(camera_id)
-        if os.path.exists(path):
-            os.remove(path)
+        async with _zone_lock(path):
+            _zones_cache.pop(camera_id, None)
+            await asyncio.to_thread(_remove_file, path)
         return True
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from app.services import tracker_service
+from app.services.tracker_service import SimpleTracker
+
+
+def _random_iou(rng: np.random.Generator, n: int, m: int) -> np.ndarray:
+    iou = rng.uniform(0.0, 1.0, (n, m))
+    # vài giá trị trùng nhau => kiểm tra luôn thứ tự tie-break
+    iou[rng.uniform(size=(n, m)) < 0.2] = 0.5
+    return iou
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (3, 7), (8, 8), (12, 5), (0, 4), (4, 0)])
+def test_greedy_match_loop_same_as_np(shape):
+    rng = np.random.default_rng(sum(shape))
+    for _ in range(20):
+        iou = _random_iou(rng, *shape)
+        rows_np, cols_np = tracker_service._greedy_match_np(iou, 0.3)
+        rows_loop, cols_loop = tracker_service._greedy_match_loop(iou, 0.3)
+        assert rows_loop.tolist() == rows_np.tolist()
+        assert cols_loop.tolist() == cols_np.tolist()
+
+
+def test_match_without_scipy_uses_greedy(monkeypatch):
+    # ép nhánh không có scipy, với cả 2 bản greedy (numpy và vòng lặp / numba)
+    monkeypatch.setattr(tracker_service, "linear_sum_assignment", None)
+    rng = np.random.default_rng(0)
+    iou = _random_iou(rng, 6, 9)
+    expected = tracker_service._greedy_match_np(iou, 0.3)
+
+    for greedy in (tracker_service._greedy_match_np, tracker_service._greedy_match):
+        monkeypatch.setattr(tracker_service, "_greedy_match", greedy)
+        rows, cols = tracker_service._match(iou, 0.3)
+        assert rows.tolist() == expected[0].tolist()
+        assert cols.tolist() == expected[1].tolist()
+
+
+def test_tracker_without_scipy_keeps_ids(monkeypatch):
+    monkeypatch.setattr(tracker_service, "linear_sum_assignment", None)
+    tracker = SimpleTracker()
+    box_a = np.array([0, 0, 40, 30], np.float32)
+    box_b = np.array([200, 200, 240, 230], np.float32)
+
+    tracker.update([(box_a, 0), (box_b, 1)])
+    assert tracker.last_track_ids == [0, 1]
+
+    # đảo thứ tự input + dịch nhẹ => vẫn giữ id cũ
+    tracker.update([(box_b + 2, 1), (box_a + 2, 0)])
+    assert tracker.last_track_ids == [1, 0]
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from app.models.detection import ZonePolygon
+from app.services import zone_service
+from app.services.zone_service import ZoneService
+
+
+def _zone(zone_id: str) -> ZonePolygon:
+    return ZonePolygon(
+        id=zone_id,
+        name=zone_id,
+        points=[{"x": 0, "y": 0}, {"x": 10, "y": 0}, {"x": 10, "y": 10}],
+    )
+
+
+@pytest.fixture(autouse=True)
+def zones_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(zone_service, "_zones_dir", lambda: str(tmp_path))
+    zone_service._zones_cache.clear()
+    zone_service._zone_locks.clear()
+    yield tmp_path
+    zone_service._zones_cache.clear()
+    zone_service._zone_locks.clear()
+
+
+def test_concurrent_add_zone_keeps_both():
+    async def run():
+        await ZoneService.add_zone("cam", _zone("base"))
+        # cache nguội => cả 2 add đều phải đọc file trong thread (có await giữa load và save)
+        zone_service._zones_cache.clear()
+        await asyncio.gather(
+            ZoneService.add_zone("cam", _zone("a")),
+            ZoneService.add_zone("cam", _zone("b")),
+        )
+        zone_service._zones_cache.clear()
+        return await ZoneService.get_zones("cam")
+
+    zones = asyncio.run(run())
+    assert sorted(z.id for z in zones) == ["a", "b", "base"]
+
+
+def test_concurrent_add_and_delete_zone():
+    async def run():
+        await ZoneService.add_zone("cam", _zone("a"))
+        zone_service._zones_cache.clear()
+        await asyncio.gather(
+            ZoneService.add_zone("cam", _zone("b")),
+            ZoneService.delete_zone("cam", "a"),
+        )
+        zone_service._zones_cache.clear()
+        return await ZoneService.get_zones("cam")
+
+    zones = asyncio.run(run())
+    assert [z.id for z in zones] == ["b"]
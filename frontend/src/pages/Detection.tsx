@@ -221,6 +221,15 @@ export default function DetectionPage() {
                 };
 
                 ws.onmessage = (event) => {
+                    // frame JPEG đến dạng binary, ngay sau message detection_result
+                    if (event.data instanceof Blob) {
+                        const frameUrl = URL.createObjectURL(event.data);
+                        setSyncedFrame((prev) => {
+                            if (prev) URL.revokeObjectURL(prev);
+                            return frameUrl;
+                        });
+                        return;
+                    }
                     try {
                     const data = JSON.parse(event.data);
                     if (data.type === "detection_result") {
@@ -228,7 +237,6 @@ export default function DetectionPage() {
                         setViolations(data.violations || []);
                         setFrameSize({ width: data.result.frame_width, height: data.result.frame_height });
                         setDebugInfo(`${data.result.total_count} vehicles (${data.result.processing_time_ms.toFixed(0)}ms)`);
-                        if (data.frame) setSyncedFrame(data.frame);
                     } else if (data.type === "connected") {
                         setDebugInfo("Video stream connected!");
                     } else if (data.type === "error") {
@@ -261,7 +269,10 @@ export default function DetectionPage() {
                 detectIntervalRef.current = null;
             }
             setResult(null);
-            setSyncedFrame(null);
+            setSyncedFrame((prev) => {
+                if (prev) URL.revokeObjectURL(prev);
+                return null;
+            });
         }
 
         return () => {